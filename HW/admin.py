@@ -0,0 +1,29 @@
+from HW.pagination import ApproximatePaginator
+
+
+class LargeTableAdminMixin:
+    """Changelist settings for tables too big to count on every page view.
+
+    The "N total" link's unfiltered COUNT(*) is skipped and page totals come
+    from ApproximatePaginator.
+    """
+    show_full_result_count = False
+    paginator = ApproximatePaginator
+
+
+class PrefixSearchAdminMixin:
+    """Admin search and autocomplete through a HW.suggest.PrefixIndex.
+
+    The term is matched as a case-insensitive prefix of the indexed field
+    instead of the icontains scan search_fields would run; search_fields
+    only has to be set so that the admin shows the search box.
+    """
+    prefix_index = None
+    prefix_search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        pks = [pk for pk, _ in self.prefix_index.suggest(search_term, self.prefix_search_limit)]
+        return queryset.filter(pk__in=pks), False
@@ -0,0 +1,99 @@
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from HW.routers import primary_reads
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else None}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def namespace(name):
+    """Return the current token of a namespace of cached pages.
+
+    Pages are keyed by this token, so changing it drops the whole namespace at
+    once. A random token (rather than a counter) keeps this safe when the LRU
+    evicts the token itself: the replacement never matches old keys.
+    """
+    key = f'ns:{name}'
+    return response_cache().get_or_set(key, lambda: uuid.uuid4().hex, None)
+
+
+def invalidate_namespace(name):
+    response_cache().set(f'ns:{name}', uuid.uuid4().hex, None)
+
+
+def invalidate_keys(keys):
+    response_cache().delete_many(list(keys))
+
+
+def _current(tokens):
+    if not tokens:
+        return True
+    states = response_cache().get_many([f'ns:{name}' for name in tokens])
+    return all(states.get(f'ns:{name}') == token for name, token in tokens.items())
+
+
+def cached_response(key_func, namespaces_func=None):
+    """Cache successful responses of a view's get() under key_func(request, **kwargs).
+
+    A key of None skips the cache for that request. namespaces_func(**kwargs)
+    may name namespaces the page depends on besides its key, e.g. its author's:
+    invalidating any of them drops the page. Misses are rendered from the
+    primary: a lagging replica would otherwise put a page older than the
+    last invalidation back in the cache, for every client.
+    """
+
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            cache = response_cache()
+            key = key_func(request, **kwargs)
+            if key is None:
+                return get(self, request, *args, **kwargs)
+            cached = cache.get(key)
+            if cached is not None and _current(cached[2]):
+                _count('hits')
+                content, content_type, _ = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            # Read before rendering, so that an invalidation during it isn't lost.
+            tokens = {name: namespace(name) for name in namespaces_func(**kwargs)} if namespaces_func else {}
+            with primary_reads():
+                response = get(self, request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type'], tokens), settings.RESPONSE_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
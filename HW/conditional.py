@@ -0,0 +1,21 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+
+def conditional_response(validators):
+    """Answer If-None-Match / If-Modified-Since on a view's get() with 304.
+
+    validators(request, **kwargs) returns (etag, last_modified) from a cheap
+    query, or None when the object doesn't exist. It runs once per request
+    even though condition() asks for the two values separately.
+    """
+
+    def get_validators(request, *args, **kwargs):
+        if not hasattr(request, '_conditional_validators'):
+            request._conditional_validators = validators(request, **kwargs) or (None, None)
+        return request._conditional_validators
+
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: get_validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: get_validators(request, *args, **kwargs)[1],
+    ))
@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class CounterFieldsMixin:
+    """Keep full saves from writing counter columns.
+
+    Counters are only changed with F() updates; a full save() of an instance
+    loaded earlier would otherwise write back its stale copy.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in skipped
+                                       and field.attname not in skipped]
+        super().save(*args, **kwargs)
+
+
+class SoftDeleteManager(models.Manager):
+    """Default manager hiding rows flagged is_deleted; `all_objects` sees them."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+    def hidden(self):
+        """The rows get_queryset() leaves out; few, and found through a partial index."""
+        return super().get_queryset().filter(is_deleted=True)
@@ -0,0 +1,308 @@
+import base64
+import binascii
+import hashlib
+import json
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+from HW.cache import response_cache
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps([direction, [str(value) for value in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('n', 'p') or not isinstance(values, list) \
+            or not all(isinstance(value, str) for value in values):
+        raise InvalidCursor(cursor)
+    return direction, values
+
+
+class CursorPage:
+
+    def __init__(self, object_list, next_cursor, prev_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """Keyset pagination over a unique ordering, e.g. ('price', 'id') or ('-rank', 'id').
+
+    Each page is a single indexed range scan, so its cost doesn't depend on
+    how deep the client has paged.
+    """
+
+    def __init__(self, object_list, ordering, per_page):
+        self.object_list = object_list
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+        self.per_page = int(per_page)
+
+    def _output_field(self, name):
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def _to_python(self, cursor, values):
+        # Cursors come from clients, so a well-formed one may still hold values of the wrong type.
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        try:
+            return [self._output_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+
+    def _keyset_filter(self, values, forward):
+        # (a, b) > (x, y)  ->  a >= x AND (a > x OR (a = x AND b > y)), with
+        # the comparisons flipped for descending fields. The OR alone can't
+        # bound an index scan; the leading a >= x is what starts it at the cursor.
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            lookup = 'gt' if field.startswith('-') != forward else 'lt'
+            clause = Q(**{f'{self.fields[position]}__{lookup}': values[position]})
+            for previous, value in zip(self.fields[:position], values):
+                clause &= Q(**{previous: value})
+            condition |= clause
+        lookup = 'gte' if self.ordering[0].startswith('-') != forward else 'lte'
+        return Q(**{f'{self.fields[0]}__{lookup}': values[0]}) & condition
+
+    def _cursor_for(self, obj, direction):
+        # Rows of a values() queryset are dicts.
+        if isinstance(obj, dict):
+            return encode_cursor([obj[field] for field in self.fields], direction)
+        return encode_cursor([getattr(obj, field) for field in self.fields], direction)
+
+    def _rows(self, direction, values):
+        """Up to per_page rows past values in direction, in page order, and whether there are more."""
+        if direction == 'n':
+            qs = self.object_list.order_by(*self.ordering)
+            if values is not None:
+                qs = qs.filter(self._keyset_filter(values, forward=True))
+        else:
+            reverse = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+            qs = self.object_list.order_by(*reverse)
+            qs = qs.filter(self._keyset_filter(values, forward=False))
+
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+        return rows, has_more
+
+    def get_page(self, cursor=None):
+        if cursor:
+            direction, values = decode_cursor(cursor)
+            values = self._to_python(cursor, values)
+        else:
+            direction, values = 'n', None
+
+        rows, has_more = self._rows(direction, values)
+        if direction == 'p':
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, values is not None
+
+        next_cursor = self._cursor_for(rows[-1], 'n') if rows and has_next else None
+        prev_cursor = self._cursor_for(rows[0], 'p') if rows and has_prev else None
+        return CursorPage(rows, next_cursor, prev_cursor)
+
+
+class KeyListPaginator(CursorPaginator):
+    """Keyset pagination over a sorted list of unique key tuples, e.g. (distance, id).
+
+    For orderings computed in Python, which a queryset can't sort by;
+    `converters` turn the cursor's strings back into key values.
+    """
+
+    def __init__(self, keys, converters, per_page):
+        self.object_list = keys
+        self.converters = tuple(converters)
+        self.per_page = int(per_page)
+
+    def _to_python(self, cursor, values):
+        if len(values) != len(self.converters):
+            raise InvalidCursor(cursor)
+        try:
+            return tuple(convert(value) for convert, value in zip(self.converters, values))
+        except (TypeError, ValueError):
+            raise InvalidCursor(cursor)
+
+    def _rows(self, direction, values):
+        if direction == 'n':
+            start = 0 if values is None else bisect_right(self.object_list, values)
+            rows = self.object_list[start:start + self.per_page]
+            return rows, start + self.per_page < len(self.object_list)
+        end = bisect_left(self.object_list, values)
+        start = max(0, end - self.per_page)
+        return self.object_list[start:end], start > 0
+
+    def _cursor_for(self, key, direction):
+        return encode_cursor(key, direction)
+
+
+def _where_sql(queryset):
+    return queryset.query.get_compiler(queryset.db).compile(queryset.query.where)
+
+
+def _hidden_rows(queryset):
+    """The rows the default manager hides, when its filter is the only one on queryset, else None."""
+    manager = queryset.model._default_manager
+    if not hasattr(manager, 'hidden'):
+        return None
+    try:
+        if _where_sql(queryset) != _where_sql(manager.db_manager(queryset.db).get_queryset()):
+            return None
+    except EmptyResultSet:
+        return None
+    return manager.hidden().using(queryset.db)
+
+
+def _table_estimate(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)',
+                       [connection.ops.quote_name(queryset.model._meta.db_table)])
+        row = cursor.fetchone()
+    # -1 means the table was never analyzed.
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+def estimated_rows(queryset):
+    """The planner's row estimate for the table of an unfiltered queryset on PostgreSQL, else None.
+
+    The default manager's own filter, e.g. the one hiding soft-deleted rows,
+    still counts as unfiltered: the few rows it hides are counted exactly and
+    taken off the estimate.
+    """
+    query = queryset.query
+    if query.distinct or query.group_by is not None:
+        return None
+    hidden = None
+    if query.where:
+        hidden = _hidden_rows(queryset)
+        if hidden is None:
+            return None
+    estimate = _table_estimate(queryset)
+    if estimate is None or hidden is None:
+        return estimate
+    return max(0, estimate - hidden.count())
+
+
+class ApproximatePaginator(Paginator):
+    """Paginator that avoids exact COUNT(*)s of large result sets.
+
+    Totals at or above PAGINATION_EXACT_COUNT_THRESHOLD come from the
+    planner's estimate for unfiltered PostgreSQL tables, or from an exact
+    count cached for PAGINATION_COUNT_TIMEOUT seconds per query otherwise.
+    count_is_exact tells which one the page got.
+    """
+
+    def _count_key(self):
+        # str(query) interpolates the parameters unquoted, so it can't tell
+        # name__in=['a, b'] from name__in=['a', 'b'].
+        sql, params = self.object_list.order_by().query.sql_with_params()
+        return f'count:{self.object_list.db}:{hashlib.sha1(repr((sql, params)).encode()).hexdigest()}'
+
+    @cached_property
+    def _total(self):
+        """(count, is_exact)"""
+        exact = Paginator.count.func
+        if not isinstance(self.object_list, QuerySet):
+            return exact(self), True
+        threshold = settings.PAGINATION_EXACT_COUNT_THRESHOLD
+
+        estimate = estimated_rows(self.object_list)
+        if estimate is not None:
+            return (estimate, False) if estimate >= threshold else (exact(self), True)
+
+        try:
+            key = self._count_key()
+        except EmptyResultSet:
+            return exact(self), True
+        cached = response_cache().get(key)
+        if cached is not None:
+            return cached, False
+        count = exact(self)
+        if count >= threshold:
+            response_cache().set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+        return count, True
+
+    @property
+    def count(self):
+        return self._total[0]
+
+    @property
+    def count_is_exact(self):
+        return self._total[1]
+
+    def validate_number(self, number):
+        if self.count_is_exact:
+            return super().validate_number(number)
+        # An estimate may be short of the real total, so don't cap the page number with it.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+def paginate(object_list, params, ordering, per_page):
+    """Return a cursor page when the request has ?cursor=, a numbered page otherwise."""
+    if 'cursor' in params:
+        return CursorPaginator(object_list, ordering, per_page).get_page(params['cursor'])
+    return ApproximatePaginator(object_list.order_by(*ordering), per_page).get_page(params.get('page'))
+
+
+def paginate_keys(keys, params, converters, per_page):
+    """paginate() for a sorted list of key tuples, see KeyListPaginator."""
+    if 'cursor' in params:
+        return KeyListPaginator(keys, converters, per_page).get_page(params['cursor'])
+    return Paginator(keys, per_page).get_page(params.get('page'))
+
+
+def page_response(items, page):
+    if isinstance(page, CursorPage):
+        return {'items': items,
+                'next': page.next_cursor,
+                'prev': page.prev_cursor}
+    return {'items': items,
+            'num_pages': page.paginator.num_pages,
+            'total': page.paginator.count,
+            'total_exact': getattr(page.paginator, 'count_is_exact', True)}
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+slow_log = logging.getLogger('HW.profiling.slow')
+
+_windows = {}
+_windows_lock = threading.Lock()
+_last_flush = 0.0
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() that times every query of a request."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context['connection'].alias, sql, (time.perf_counter() - start) * 1000))
+
+    @property
+    def db_ms(self):
+        return sum(duration for _, _, duration in self.queries)
+
+
+def record(pattern, total_ms, db_ms, queries):
+    with _windows_lock:
+        window = _windows.get(pattern)
+        if window is None:
+            window = _windows[pattern] = deque(maxlen=settings.PROFILING_WINDOW)
+        window.append((round(total_ms, 3), round(db_ms, 3), queries))
+
+
+def snapshot():
+    with _windows_lock:
+        return {pattern: list(window) for pattern, window in _windows.items()}
+
+
+def reset():
+    with _windows_lock:
+        _windows.clear()
+
+
+def flush():
+    """Write this process's windows to PROFILING_DIR for `manage.py profile_stats`."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{os.getpid()}.json'
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps({'written_at': time.time(), 'windows': snapshot()}))
+    os.replace(tmp_path, path)
+
+
+def load_windows(max_age=None):
+    """Merge the windows flushed by every worker, skipping ones older than max_age seconds."""
+    merged = {}
+    directory = Path(settings.PROFILING_DIR)
+    if not directory.is_dir():
+        return merged
+    for path in directory.glob('*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if max_age is not None and time.time() - data['written_at'] > max_age:
+            continue
+        for pattern, samples in data['windows'].items():
+            merged.setdefault(pattern, []).extend(samples)
+    return merged
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _pattern(request):
+    match = request.resolver_match
+    route = match.route if match is not None else '<unmatched>'
+    return f'{request.method} /{route}'
+
+
+class ProfilingMiddleware:
+    """Per-request query count, DB time and Python time.
+
+    Adds a Server-Timing header, keeps a rolling window of samples per URL
+    pattern and logs requests over PROFILING_SLOW_MS or PROFILING_SLOW_QUERIES
+    to the 'HW.profiling.slow' logger together with their SQL. When
+    PROFILING_ENABLED is off Django drops the middleware at startup.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.db_ms
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="{len(recorder.queries)} queries"',
+            f'app;dur={total_ms - db_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        pattern = _pattern(request)
+        record(pattern, total_ms, db_ms, len(recorder.queries))
+        if total_ms >= settings.PROFILING_SLOW_MS or len(recorder.queries) >= settings.PROFILING_SLOW_QUERIES:
+            self.log_slow(request, response, pattern, total_ms, recorder)
+        if time.monotonic() - _last_flush >= settings.PROFILING_FLUSH_INTERVAL:
+            flush()
+        return response
+
+    def log_slow(self, request, response, pattern, total_ms, recorder):
+        # Repeated statements are the usual sign of a lazy load in a loop.
+        repeated = Counter(sql for _, sql, _ in recorder.queries)
+        queries = sorted(recorder.queries, key=lambda query: query[2], reverse=True)
+        slow_log.warning(json.dumps({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'pattern': pattern,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'db_ms': round(recorder.db_ms, 3),
+            'python_ms': round(total_ms - recorder.db_ms, 3),
+            'queries': len(recorder.queries),
+            'sql': [{'alias': alias, 'sql': sql, 'ms': round(duration, 3), 'repeated': repeated[sql]}
+                    for alias, sql, duration in queries[:settings.PROFILING_LOG_QUERIES]],
+        }, ensure_ascii=False))
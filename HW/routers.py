@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+# True while the current request may read from a replica.
+_replica_reads = ContextVar('replica_reads', default=False)
+# The replica the current request last read from.
+_last_replica = ContextVar('last_replica', default=None)
+
+_down_until = {}
+_cycle_lock = threading.Lock()
+_cycle = None
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _mark_down(alias):
+    logger.warning('replica %s is down; reading from the primary for %ss', alias, settings.REPLICA_RETRY_SECONDS)
+    _down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def _healthy(alias):
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _mark_down(alias)
+        return False
+    _down_until.pop(alias, None)
+    return True
+
+
+def _next_replica():
+    global _cycle
+    replicas = settings.DATABASE_REPLICAS
+    with _cycle_lock:
+        if _cycle is None or _cycle[0] != replicas:
+            _cycle = (replicas, itertools.cycle(replicas))
+        candidates = [next(_cycle[1]) for _ in replicas]
+    return next((alias for alias in candidates if _healthy(alias)), None)
+
+
+def reset():
+    """Forget replica health and restart the round-robin."""
+    global _cycle
+    with _cycle_lock:
+        _cycle = None
+    _down_until.clear()
+
+
+@contextmanager
+def primary_reads():
+    """Keep the reads inside the block on the primary."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def primary_only(view):
+    """Keep the reads of a view function or class on the primary even for GET requests."""
+    view.primary_only = True
+    return view
+
+
+def _is_primary_only(view_func):
+    return getattr(view_func, 'primary_only', False) or getattr(getattr(view_func, 'view_class', None),
+                                                                'primary_only', False)
+
+
+class ReplicaRouter:
+    """Send reads to DATABASE_REPLICAS, round-robin, while ReplicaMiddleware allows it.
+
+    Everything else, including reads after a write in the same request, goes
+    to the primary. A replica that fails to connect is skipped for
+    REPLICA_RETRY_SECONDS.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get():
+            alias = _next_replica()
+            _last_replica.set(alias)
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        _replica_reads.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Let safe requests to the REPLICA_APPS views read from replicas.
+
+    A write sets a cookie that keeps the client's reads on the primary for
+    REPLICA_STICKY_SECONDS, so it sees its own changes despite replication lag.
+    A view that fails with OperationalError while reading from a replica, e.g.
+    over a connection that died since it was opened, is run again on the
+    primary and the replica is skipped for REPLICA_RETRY_SECONDS. Lag itself
+    isn't measured.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token, replica_token = _replica_reads.set(False), _last_replica.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+            _last_replica.reset(replica_token)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in SAFE_METHODS
+                and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+                and not _is_primary_only(view_func)
+                and view_func.__module__.split('.')[0] in settings.REPLICA_APPS):
+            _replica_reads.set(True)
+            request._replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        alias = _last_replica.get()
+        if not (isinstance(exception, OperationalError) and _replica_reads.get() and alias):
+            return None
+        _mark_down(alias)
+        try:
+            connections[alias].close()
+        except DatabaseError:
+            pass
+        _replica_reads.set(False)
+        view_func, view_args, view_kwargs = request._replica_view
+        if asyncio.iscoroutinefunction(view_func):
+            return async_to_sync(view_func)(request, *view_args, **view_kwargs)
+        return view_func(request, *view_args, **view_kwargs)
@@ -0,0 +1,152 @@
+from django.db.models.fields.files import FieldFile
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+# Primary keys are BigAutoFields; a bigger id overflows the database parameter.
+MAX_ID = 2 ** 63 - 1
+
+
+def ids_param(request, limit):
+    """Parse ?ids=1,2,3 into a list of distinct ints in request order; ValueError if invalid."""
+    try:
+        ids = list(dict.fromkeys(int(value) for value in request.GET.get('ids', '').split(',') if value.strip()))
+    except ValueError:
+        raise ValueError('ids must be comma-separated integers')
+    if not all(1 <= pk <= MAX_ID for pk in ids):
+        raise ValueError(f'ids must be between 1 and {MAX_ID}')
+    if not ids:
+        raise ValueError('ids is required')
+    if len(ids) > limit:
+        raise ValueError(f'at most {limit} ids')
+    return ids
+
+
+class Field:
+    """An output key read from a column or a related column ('author__username')."""
+
+    def __init__(self, source=None, transform=None):
+        self.source = source
+        self.transform = transform
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        if self.source is None:
+            self.source = name
+
+    def to_value(self, value):
+        if value is None or self.transform is None:
+            return value
+        return self.transform(value)
+
+
+class Many(Field):
+    """A list of `attr` values over a many-to-many field."""
+
+    def __init__(self, source=None, attr='pk'):
+        super().__init__(source)
+        self.attr = attr
+
+
+class Serializer:
+    """Declarative JSON shape of a model, e.g.
+
+        class UserSerializer(Serializer):
+            model = User
+            username = Field()
+            locations = Many(attr='name')
+
+    Querysets are reduced to the declared columns with values(), so reads
+    never build model instances; joins come from the related lookups and each
+    Many field costs one extra query per page. Clients may ask for a subset
+    of the fields with ?fields=a,b.
+    """
+    model = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        declared = {}
+        for base in reversed(cls.__mro__):
+            declared.update((name, value) for name, value in vars(base).items() if isinstance(value, Field))
+        cls.declared_fields = declared
+        cls._plans = {}
+
+    def __init__(self, fields=None):
+        if fields is None:
+            names = tuple(self.declared_fields)
+        else:
+            unknown = set(fields) - set(self.declared_fields)
+            if unknown:
+                raise InvalidFields(f'unknown fields: {", ".join(sorted(unknown))}')
+            names = tuple(name for name in self.declared_fields if name in fields)
+        # Plans are compiled once per distinct field set.
+        plan = self._plans.get(names)
+        if plan is None:
+            plan = self._plans[names] = self._compile(names)
+        self.fields, self.columns = plan
+
+    @classmethod
+    def _compile(cls, names):
+        fields = [cls.declared_fields[name] for name in names]
+        columns = [field.source for field in fields if not isinstance(field, Many)]
+        if len(columns) < len(fields):
+            columns.insert(0, 'pk')
+        return fields, tuple(dict.fromkeys(columns))
+
+    @classmethod
+    def from_request(cls, request):
+        fields = request.GET.get('fields')
+        if fields is None:
+            return cls()
+        return cls([name.strip() for name in fields.split(',') if name.strip()])
+
+    def queryset(self, queryset, *extra):
+        """Select the declared columns plus `extra` ones, e.g. the pagination keys."""
+        return queryset.values(*dict.fromkeys(self.columns + extra))
+
+    def _many_values(self, field, pks):
+        m2m = self.model._meta.get_field(field.source)
+        through = m2m.remote_field.through
+        source, target = m2m.m2m_field_name(), m2m.m2m_reverse_field_name()
+        values = {pk: [] for pk in pks}
+        for pk, value in through.objects.filter(**{f'{source}__in': pks}).order_by('pk')\
+                .values_list(f'{source}_id', f'{target}__{field.attr}'):
+            values[pk].append(value)
+        return values
+
+    def serialize(self, rows):
+        rows = list(rows)
+        many = {field.name: self._many_values(field, [row['pk'] for row in rows])
+                for field in self.fields if isinstance(field, Many) and rows}
+        return [{field.name: many[field.name][row['pk']] if isinstance(field, Many)
+                 else field.to_value(row[field.source])
+                 for field in self.fields}
+                for row in rows]
+
+    def serialize_one(self, row):
+        return self.serialize([row])[0]
+
+    def serialize_batch(self, queryset, pks):
+        """Serialize the rows with these pks in their order; return (items, missing pks)."""
+        rows = {row['pk']: row for row in self.queryset(queryset.filter(pk__in=pks), 'pk')}
+        items = self.serialize(rows[pk] for pk in pks if pk in rows)
+        return items, [pk for pk in pks if pk not in rows]
+
+    def instance(self, obj, **values):
+        """Serialize a model instance already in memory; `values` override fields."""
+        data = {}
+        for field in self.fields:
+            if field.name in values:
+                data[field.name] = values[field.name]
+            elif isinstance(field, Many):
+                data[field.name] = [getattr(related, field.attr) for related in getattr(obj, field.source).all()]
+            else:
+                value = obj
+                for attr in field.source.split('__'):
+                    value = getattr(value, attr)
+                if isinstance(value, FieldFile):
+                    value = value.name
+                data[field.name] = field.to_value(value)
+        return data
@@ -42,7 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'HW.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'HW.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,6 +90,27 @@ DATABASES = {
     }
 }
 
+# Read replicas. Set DB_REPLICA_HOST to route reads to one. Without it the
+# 'replica' alias is still defined, as a mirror of default in tests, but
+# nothing is routed to it.
+DATABASES['replica'] = {**DATABASES['default'], 'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+                        'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = ['replica'] if os.environ.get('DB_REPLICA_HOST') else []
+DATABASE_ROUTERS = ['HW.routers.ReplicaRouter']
+REPLICA_APPS = ('ads', 'users')
+REPLICA_STICKY_SECONDS = 5
+REPLICA_STICKY_COOKIE = 'read_primary'
+REPLICA_RETRY_SECONDS = 30
+
+CACHES = {
+    'default': {
+        # LocMemCache evicts least recently used entries past MAX_ENTRIES.
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -131,5 +154,56 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/images/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'images')
-
-TOTAL_ON_PAGE = 5
\ No newline at end of file
+# Served by ads.media.MediaView. Content-hashed names are cached as immutable,
+# others for MEDIA_MAX_AGE seconds. MEDIA_OFFLOAD hands the body to the front
+# proxy: 'x-accel-redirect' (nginx, an internal location at MEDIA_ACCEL_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile).
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD') or None
+MEDIA_ACCEL_PREFIX = '/protected-images/'
+
+TOTAL_ON_PAGE = 5
+# /ads/nearby/ lists at most this many of the nearest adverts.
+NEARBY_MAX_RESULTS = 1000
+# Page totals at or above this are estimated (HW.pagination.ApproximatePaginator).
+PAGINATION_EXACT_COUNT_THRESHOLD = 10_000
+PAGINATION_COUNT_TIMEOUT = 30
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 60
+
+EXPORT_CHUNK_SIZE = 2000
+
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+# Most ids one /ads/batch/ or /user/batch/ request may ask for.
+BATCH_MAX_IDS = 100
+
+# Rows per transaction when ads.purge removes what deleted users and categories leave behind.
+PURGE_BATCH_SIZE = 1000
+
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_THUMBNAIL_SIZES = {'small': 150, 'medium': 400, 'large': 1024}
+IMAGE_WORKERS = 2
+
+# Request profiling (HW.profiling). Rolling windows are flushed to
+# PROFILING_DIR and read by `manage.py profile_stats`.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_SLOW_MS = 500
+PROFILING_SLOW_QUERIES = 30
+PROFILING_LOG_QUERIES = 20
+PROFILING_WINDOW = 1000
+PROFILING_FLUSH_INTERVAL = 10
+PROFILING_DIR = BASE_DIR / 'profiling'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'HW.profiling.slow': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
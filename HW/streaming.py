@@ -0,0 +1,45 @@
+import zlib
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield (_encoder.encode(row) + '\n').encode('utf-8')
+
+
+def _gzipped(chunks):
+    # wbits=31 produces a gzip container rather than a bare zlib stream.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def ndjson_response(request, rows, filename):
+    """Stream rows as NDJSON, gzipped on the fly when the client accepts it.
+
+    WSGI only. Django 4.0's ASGI handler iterates streaming bodies in the
+    event loop, where the queryset behind rows can't run, and rendering the
+    whole export up front would hold it in memory; ASGI requests get a 501.
+    """
+    if isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'exports are only served by the WSGI application'}, status=501)
+
+    chunks = _ndjson_lines(rows)
+    gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if gzip:
+        chunks = _gzipped(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Vary'] = 'Accept-Encoding'
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,89 @@
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+
+def fold(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def suggest_params(request):
+    """Return (prefix, limit) from ?prefix=&limit=, raising ValueError with a message."""
+    prefix = request.GET.get('prefix', '').strip()
+    if not prefix:
+        raise ValueError('prefix is required')
+    try:
+        limit = int(request.GET.get('limit', settings.SUGGEST_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= settings.SUGGEST_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {settings.SUGGEST_MAX_LIMIT}')
+    return prefix, limit
+
+
+class PrefixIndex:
+    """Process-local, sorted index of a unique text field for prefix lookups.
+
+    Entries are (folded text, text, pk) tuples in one sorted list, so a
+    lookup is a bisect to the first match followed by a short scan. Built
+    from the default manager on first use and kept current from signals,
+    once the write commits, afterwards; until then updates are ignored.
+    """
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self._entries = []
+        self._by_pk = {}
+        self._lock = threading.Lock()
+        self.built = False
+
+    def build(self, using=None):
+        with self._lock:
+            if self.built:
+                return
+            rows = self.model._default_manager.db_manager(using).values_list('pk', self.field).iterator()
+            for pk, text in rows:
+                self._by_pk[pk] = (fold(text), text, pk)
+            self._entries = sorted(self._by_pk.values())
+            self.built = True
+
+    def _remove(self, pk):
+        entry = self._by_pk.pop(pk, None)
+        if entry is not None:
+            del self._entries[bisect_left(self._entries, entry)]
+
+    def update(self, instance):
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(instance.pk)
+            entry = self._by_pk[instance.pk] = (fold(getattr(instance, self.field)), getattr(instance, self.field),
+                                                instance.pk)
+            insort(self._entries, entry)
+
+    def remove(self, pk):
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(pk)
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._by_pk.clear()
+            self.built = False
+
+    def suggest(self, prefix, limit):
+        """Return up to `limit` (pk, text) pairs starting with prefix, case-insensitively, in order."""
+        self.build()
+        prefix = fold(prefix)
+        with self._lock:
+            position = bisect_left(self._entries, (prefix,))
+            matches = []
+            for folded, text, pk in self._entries[position:position + limit]:
+                if not folded.startswith(prefix):
+                    break
+                matches.append((pk, text))
+        return matches
@@ -0,0 +1,56 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+def load_object(body):
+    """Parse a JSON object request body; anything else raises ValueError."""
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError('body must be a JSON object')
+    return data
+
+
+def to_python(field, value):
+    """field.to_python(), except that text fields only take strings; to_python() would str() anything."""
+    if isinstance(field, (models.CharField, models.TextField)) and value is not None and not isinstance(value, str):
+        raise ValidationError('must be a string')
+    return field.to_python(value)
+
+
+def apply_changes(instance, data, fields):
+    """Set the `fields` present in `data` on instance and return the names that changed.
+
+    Foreign keys take a primary key. Unknown keys and invalid values raise
+    ValidationError; only the changed fields are validated, uniqueness included.
+    """
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise ValidationError({name: ['unknown or read-only field'] for name in sorted(unknown)})
+
+    changed = []
+    for name in fields:
+        if name not in data:
+            continue
+        field = instance._meta.get_field(name)
+        try:
+            value = to_python(field, data[name])
+        except ValidationError as e:
+            raise ValidationError({name: e.messages})
+        if getattr(instance, field.attname) != value:
+            setattr(instance, field.attname, value)
+            changed.append(name)
+
+    unchanged = [field.name for field in instance._meta.fields if field.name not in changed]
+    instance.clean_fields(exclude=unchanged)
+    instance.validate_unique(exclude=unchanged)
+    return changed
+
+
+def save_changes(instance, changed):
+    """Write only the `changed` columns, plus the auto_now ones; nothing if none changed."""
+    if not changed:
+        return
+    auto_now = [field.name for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)]
+    instance.save(update_fields=list(dict.fromkeys([*changed, *auto_now])))
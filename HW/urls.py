@@ -1,11 +1,16 @@
+import re
+
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from ads.media import MediaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('ads.urls')),
-    path('user/', include('users.urls'))
-]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path('user/', include('users.urls')),
+    path('async/', include('ads.async_urls')),
+    path('async/user/', include('users.async_urls')),
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<name>.+)$', MediaView.as_view()),
+]
\ No newline at end of file
@@ -1,14 +1,61 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models.functions import Now
+
+from HW.admin import LargeTableAdminMixin, PrefixSearchAdminMixin
+from HW.cache import invalidate_keys, invalidate_namespace
+from ads import counters
+from ads.cache import advert_detail_key
 from ads.models import Advert, Category
+from ads.search import match_adverts
+from ads.suggest import category_index
+
+
+def set_published(queryset, is_published):
+    """Publish or unpublish the adverts of queryset with one UPDATE; return how many changed."""
+    changing = queryset.exclude(is_published=is_published)
+    with transaction.atomic(using=queryset.db):
+        rows = list(changing.select_for_update().values_list('pk', 'author_id', 'category_id'))
+        if rows:
+            changing.update(is_published=is_published, updated_at=Now())
+            counters.apply([(author_id, category_id, not is_published) for _, author_id, category_id in rows],
+                           [(author_id, category_id, is_published) for _, author_id, category_id in rows],
+                           queryset.db)
+    # update() sends no post_save.
+    if rows:
+        invalidate_keys([advert_detail_key(None, pk) for pk, _, _ in rows])
+        invalidate_namespace('ads:list')
+    return len(rows)
+
+
+@admin.register(Advert)
+class AdvertAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'name', 'author', 'category', 'price', 'is_published')
+    list_select_related = ('author', 'category')
+    # Both lead an (x, price, id) index.
+    list_filter = ('is_published', 'category')
+    search_fields = ('name', 'description')
+    autocomplete_fields = ('author', 'category')
+    actions = ('publish', 'unpublish')
+
+    def get_search_results(self, request, queryset, search_term):
+        # On PostgreSQL, the full-text index rather than icontains over every row.
+        if not search_term.strip():
+            return queryset, False
+        return match_adverts(queryset, search_term), False
+
+    @admin.action(description='Опубликовать выбранные объявления')
+    def publish(self, request, queryset):
+        self.message_user(request, f'Опубликовано: {set_published(queryset, True)}', messages.SUCCESS)
 
-#
-# class AdvertAdmin(admin.ModelAdmin):
-#     pass
-#
-#
-# class CategoriesAdmin(admin.ModelAdmin):
-#     pass
+    @admin.action(description='Снять с публикации выбранные объявления')
+    def unpublish(self, request, queryset):
+        self.message_user(request, f'Снято с публикации: {set_published(queryset, False)}', messages.SUCCESS)
 
 
-admin.site.register(Advert)
-admin.site.register(Category)
\ No newline at end of file
+@admin.register(Category)
+class CategoryAdmin(PrefixSearchAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'adverts_count')
+    ordering = ('name',)
+    search_fields = ('name',)
+    prefix_index = category_index
@@ -0,0 +1,9 @@
+from django.urls import path
+from ads import async_views
+
+urlpatterns = [
+    path('ads/', async_views.advert_list),
+    path('ads/<int:pk>/', async_views.advert_detail),
+    path('cat/', async_views.category_list),
+    path('cat/<int:pk>/', async_views.category_detail),
+]
@@ -0,0 +1,66 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from HW import settings
+from HW.pagination import InvalidCursor, page_response, paginate
+from HW.serializers import InvalidFields
+from ads.filters import InvalidFilter, filter_adverts
+from ads.models import Advert, Category
+from ads.serializers import AdvertSerializer, CategorySerializer
+
+# Native async read endpoints for HW.asgi. Django 4.0's ORM has no async
+# query API yet, so each endpoint runs its queries in a single
+# sync_to_async hop; the event loop stays free while the response is
+# written to slow clients.
+
+
+@sync_to_async
+def _advert_page(serializer, params):
+    adverts = filter_adverts(Advert.objects.all(), params)
+    page_list = paginate(serializer.queryset(adverts, 'price', 'id'), params, ('price', 'id'), settings.TOTAL_ON_PAGE)
+    return page_response(serializer.serialize(page_list), page_list)
+
+
+async def advert_list(request):
+    try:
+        response = await _advert_page(AdvertSerializer.from_request(request), request.GET)
+    except (InvalidFilter, InvalidFields) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except InvalidCursor:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    return JsonResponse(response, safe=False)
+
+
+@sync_to_async
+def _detail(serializer, queryset, pk):
+    return serializer.serialize_one(get_object_or_404(serializer.queryset(queryset), pk=pk))
+
+
+async def advert_detail(request, pk):
+    try:
+        serializer = AdvertSerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(await _detail(serializer, Advert.objects.all(), pk))
+
+
+@sync_to_async
+def _category_list(serializer):
+    return serializer.serialize(serializer.queryset(Category.objects.order_by('name')))
+
+
+async def category_list(request):
+    try:
+        serializer = CategorySerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(await _category_list(serializer), safe=False)
+
+
+async def category_detail(request, pk):
+    try:
+        serializer = CategorySerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(await _detail(serializer, Category.objects.all(), pk))
@@ -0,0 +1,112 @@
+from urllib.parse import urlencode
+
+from django.db.models import Count, Max
+
+from HW.cache import invalidate_keys, invalidate_namespace, namespace
+from ads.filters import InvalidFilter, filter_adverts
+from ads.models import Advert, Category
+from users.models import User
+
+
+def _query(request):
+    return urlencode(sorted(request.GET.items()))
+
+
+# Detail pages are purged by key, which only covers the full representation,
+# so sparse fieldsets (?fields=) of a single object are never cached.
+
+def advert_detail_key(request, pk):
+    if request is not None and 'fields' in request.GET:
+        return None
+    return f'ads:detail:{pk}'
+
+
+def advert_list_key(request):
+    return f'ads:list:{namespace("ads:list")}:{_query(request)}'
+
+
+def category_detail_key(request, pk):
+    if request is not None and 'fields' in request.GET:
+        return None
+    return f'cat:detail:{pk}'
+
+
+def category_list_key(request):
+    return f'cat:list:{namespace("cat:list")}:{_query(request)}'
+
+
+def advert_detail_namespaces(pk):
+    # Adverts embed the author's username and the category's name.
+    row = Advert.objects.filter(pk=pk).values_list('author_id', 'category_id').first()
+    if row is None:
+        return []
+    author_id, category_id = row
+    return [f'ads:author:{author_id}'] + ([f'ads:category:{category_id}'] if category_id is not None else [])
+
+
+def invalidate_advert(advert_id):
+    invalidate_keys([advert_detail_key(None, advert_id)])
+    invalidate_namespace('ads:list')
+
+
+def invalidate_category(category_id):
+    invalidate_keys([category_detail_key(None, category_id)])
+    invalidate_namespace(f'ads:category:{category_id}')
+    invalidate_namespace('cat:list')
+    invalidate_namespace('ads:list')
+
+
+def invalidate_category_counts(category_ids):
+    invalidate_keys([category_detail_key(None, pk) for pk in category_ids])
+    invalidate_namespace('cat:list')
+
+
+def invalidate_author(user_id):
+    invalidate_namespace(f'ads:author:{user_id}')
+    invalidate_namespace('ads:list')
+
+
+def _latest(*timestamps):
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+# Conditional GET validators. Adverts embed the author's username and the
+# category's name, so their validators also cover those rows.
+
+def advert_detail_validators(request, pk):
+    row = Advert.objects.filter(pk=pk)\
+        .values('updated_at', 'author__updated_at', 'category__updated_at').first()
+    if row is None:
+        return None
+    last_modified = _latest(*row.values())
+    return f'ad-{pk}-{last_modified.timestamp()}-{_query(request)}', last_modified
+
+
+def advert_list_validators(request):
+    # From the database rather than the ads:list token: that lives in each
+    # process's own cache, and bulk loads and commands never bump it. Author
+    # and category changes are taken table-wide, from their updated_at index.
+    try:
+        adverts = filter_adverts(Advert.objects.all(), request.GET)
+    except InvalidFilter:
+        return None
+    row = adverts.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+    last_modified = _latest(row['updated_at'], User.all_objects.aggregate(Max('updated_at'))['updated_at__max'],
+                            Category.all_objects.aggregate(Max('updated_at'))['updated_at__max'])
+    if last_modified is None:
+        return None
+    return f'ads-{row["count"]}-{last_modified.timestamp()}-{_query(request)}', last_modified
+
+
+def category_detail_validators(request, pk):
+    updated_at = Category.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return f'cat-{pk}-{updated_at.timestamp()}-{_query(request)}', updated_at
+
+
+def category_list_validators(request):
+    row = Category.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+    if row['updated_at'] is None:
+        return None
+    return f'cats-{row["count"]}-{row["updated_at"].timestamp()}-{_query(request)}', row['updated_at']
@@ -0,0 +1,100 @@
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
+
+from ads.cache import invalidate_category_counts
+from ads.models import Advert, Category
+from users.models import User
+
+# User.published_adverts_count and Category.adverts_count are kept in step
+# with the adverts table by applying the difference between an advert's
+# state before and after each write.
+
+
+COUNTED_FIELDS = ('author_id', 'category_id', 'is_published')
+
+
+def counted_state(advert):
+    """Return (author_id, category_id, is_published), or None if not all loaded."""
+    values = advert.__dict__
+    if not set(COUNTED_FIELDS) <= values.keys():
+        return None
+    return tuple(values[attname] for attname in COUNTED_FIELDS)
+
+
+def locked_state(pk, using='default'):
+    """Lock an advert's row for the rest of the transaction and return its state, None if it's gone."""
+    return Advert.all_objects.using(using).select_for_update().filter(pk=pk).values_list(*COUNTED_FIELDS).first()
+
+
+def saved_state(advert, before, update_fields=None):
+    """Return the state save() left in the row: the written fields over the `before` state."""
+    if before is None:
+        return counted_state(advert)
+    values = advert.__dict__
+    written = values.keys() if update_fields is None \
+        else {advert._meta.get_field(name).attname for name in update_fields}
+    return tuple(values[attname] if attname in values and attname in written else old
+                 for attname, old in zip(COUNTED_FIELDS, before))
+
+
+def deltas(before, after):
+    """Return the (user, category) counter changes for lists of states; None states are skipped."""
+    users, categories = Counter(), Counter()
+    for states, sign in ((before, -1), (after, 1)):
+        for state in states:
+            if state is None:
+                continue
+            author_id, category_id, is_published = state
+            if is_published:
+                users[author_id] += sign
+            if category_id is not None:
+                categories[category_id] += sign
+    return users, categories
+
+
+def _apply(model, field, changes, extra, using):
+    by_delta = defaultdict(list)
+    for pk, delta in changes.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.using(using).filter(pk__in=pks).update(**{field: F(field) + delta}, **extra)
+
+
+def apply(before, after, using='default'):
+    """Apply counter changes for adverts going from `before` to `after` states.
+
+    Call inside the transaction that writes the adverts.
+    """
+    users, categories = deltas(before, after)
+    _apply(User, 'published_adverts_count', users, {}, using)
+    # Category responses show the count, so their validators must move too.
+    _apply(Category, 'adverts_count', categories, {'updated_at': Now()}, using)
+    changed = [pk for pk, delta in categories.items() if delta]
+    if changed:
+        transaction.on_commit(partial(invalidate_category_counts, changed), using=using)
+
+
+def _count(group_by, **filters):
+    # Adverts of deleted users still count until the purger removes them.
+    adverts = Advert.all_objects.filter(**{group_by: OuterRef('pk')}, **filters).order_by().values(group_by)
+    return Coalesce(Subquery(adverts.annotate(count=Count('id')).values('count')), Value(0))
+
+
+def recount(using='default'):
+    """Repair drifted counters; return (users fixed, categories fixed)."""
+    fixed = []
+    for model, field, actual in (
+        (User, 'published_adverts_count', _count('author', is_published=True)),
+        (Category, 'adverts_count', _count('category')),
+    ):
+        drifted = model.objects.using(using).annotate(actual=actual).exclude(**{field: F('actual')})\
+            .values_list('pk', 'actual')
+        rows = [model(pk=pk, **{field: count}) for pk, count in drifted.iterator()]
+        model.objects.using(using).bulk_update(rows, [field], batch_size=1000)
+        fixed.append(len(rows))
+    return tuple(fixed)
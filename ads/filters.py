@@ -0,0 +1,50 @@
+from decimal import Decimal, InvalidOperation
+
+from HW.serializers import MAX_ID
+from ads.search import match_adverts
+
+BOOLEANS = {'true': True, '1': True, 'false': False, '0': False}
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def _decimal(name, value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise InvalidFilter(f'{name} must be a number')
+
+
+def _id(name, value):
+    try:
+        pk = int(value)
+    except ValueError:
+        raise InvalidFilter(f'{name} must be an integer')
+    if not 1 <= pk <= MAX_ID:
+        raise InvalidFilter(f'{name} must be between 1 and {MAX_ID}')
+    return pk
+
+
+def filter_adverts(queryset, params):
+    """Apply the list filters from a QueryDict.
+
+    Each equality filter leads one of the composite (<field>, price, id)
+    indexes on Advert, so the filter and the price ordering share an index.
+    """
+    if params.get('price_min'):
+        queryset = queryset.filter(price__gte=_decimal('price_min', params['price_min']))
+    if params.get('price_max'):
+        queryset = queryset.filter(price__lte=_decimal('price_max', params['price_max']))
+    if params.get('category'):
+        queryset = queryset.filter(category_id=_id('category', params['category']))
+    if params.get('author'):
+        queryset = queryset.filter(author_id=_id('author', params['author']))
+    if params.get('is_published'):
+        if params['is_published'].lower() not in BOOLEANS:
+            raise InvalidFilter('is_published must be true or false')
+        queryset = queryset.filter(is_published=BOOLEANS[params['is_published'].lower()])
+    if params.get('q'):
+        queryset = match_adverts(queryset, params['q'])
+    return queryset
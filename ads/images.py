@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from ads.cache import invalidate_advert
+from ads.models import Advert
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+HASHED_NAME_RE = re.compile(r'^images/(?P<digest>[0-9a-f]{32})\.(?P<ext>jpg|png|gif|webp)$')
+# Originals and their variants (_small, _full, ...).
+HASHED_FILE_RE = re.compile(r'^images/[0-9a-f]{32}(_[a-z0-9]+)?\.(jpg|png|gif|webp)$')
+
+_executor = None
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images')
+    return _executor
+
+
+def validate(upload):
+    """Check size, format and pixel count from the header, without decoding the image."""
+    if upload.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        raise InvalidImage('image is too large')
+    try:
+        with Image.open(upload) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidImage('not a valid image')
+    if image_format not in FORMATS:
+        raise InvalidImage(f'unsupported image format {image_format}')
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise InvalidImage('image dimensions are too large')
+    return FORMATS[image_format]
+
+
+def store(upload):
+    """Save an upload under its content hash and return the storage name.
+
+    The upload is hashed chunk by chunk; large uploads are already spooled to a
+    temporary file, which the storage moves into place instead of copying.
+    Identical images share one file.
+    """
+    extension = validate(upload)
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+
+    name = f'images/{digest.hexdigest()[:32]}{extension}'
+    if not default_storage.exists(name):
+        upload.seek(0)
+        default_storage.save(name, upload)
+    return name
+
+
+def variant_names(name):
+    """Return {label: storage name} of the derived images, {} for legacy unhashed names."""
+    match = HASHED_NAME_RE.match(name or '')
+    if not match:
+        return {}
+    base = f'images/{match["digest"]}'
+    variants = {label: f'{base}_{size}.{match["ext"]}' for label, size in settings.IMAGE_THUMBNAIL_SIZES.items()}
+    variants['webp'] = f'{base}_full.webp'
+    return variants
+
+
+def is_immutable(name):
+    """Content-hashed files are never rewritten under the same name."""
+    return HASHED_FILE_RE.match(name) is not None
+
+
+def ready_variant_urls(name):
+    """Return ({label: url} of the variants already written, [labels still being processed])."""
+    urls, pending = {}, []
+    for label, variant in variant_names(name).items():
+        if default_storage.exists(variant):
+            urls[label] = default_storage.url(variant)
+        else:
+            pending.append(label)
+    return urls, pending
+
+
+def process(name):
+    """Write the thumbnails and the WebP variant of a stored image."""
+    variants = variant_names(name)
+    written = False
+    with Image.open(default_storage.path(name)) as image:
+        image.load()
+        for label, size in settings.IMAGE_THUMBNAIL_SIZES.items():
+            path = default_storage.path(variants[label])
+            if not os.path.exists(path):
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size))
+                _save_atomically(thumbnail, path, image.format)
+                written = True
+
+        path = default_storage.path(variants['webp'])
+        if not os.path.exists(path):
+            _save_atomically(image, path, 'WEBP')
+            written = True
+    if written:
+        _refresh_adverts(name)
+
+
+def _refresh_adverts(name):
+    # Their pages only link variants that exist, so they change now: bump
+    # updated_at for the conditional GET validators and drop cached copies.
+    advert_ids = list(Advert.all_objects.filter(image=name).values_list('pk', flat=True))
+    if advert_ids:
+        Advert.all_objects.filter(pk__in=advert_ids).update(updated_at=timezone.now())
+        for advert_id in advert_ids:
+            invalidate_advert(advert_id)
+
+
+def _save_atomically(image, path, image_format):
+    # Readers never see a half-written file. Two workers may process the same
+    # upload at once, so the temporary name is per thread.
+    tmp_path = f'{path}.tmp{os.getpid()}-{threading.get_ident()}'
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(tmp_path, format=image_format)
+    os.replace(tmp_path, path)
+
+
+def _log_failure(future):
+    if future.exception():
+        logger.error('image processing failed', exc_info=future.exception())
+
+
+def _process_in_worker(name):
+    try:
+        process(name)
+    finally:
+        # The worker threads outlive any request, so nothing else closes their connections.
+        connections.close_all()
+
+
+def schedule(name):
+    """Process an image on the bounded worker pool, off the request path."""
+    future = executor().submit(_process_in_worker, name)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def wait():
+    """Block until every scheduled image is processed; the next schedule() starts a new pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+from ads.models import Advert, Category
+from users.models import User
+
+
+def summary(timings, elapsed):
+    cuts = quantiles(timings, n=100)
+    return f'p50 {cuts[49] * 1000:7.2f} ms  p95 {cuts[94] * 1000:7.2f} ms  {len(timings) / elapsed:8.1f} req/s'
+
+
+class Command(BaseCommand):
+    help = 'Compare latency and throughput of the sync (WSGI) and async (ASGI) read endpoints on the current data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        advert, category, user = Advert.objects.first(), Category.objects.first(), User.objects.first()
+        if not (advert and category and user):
+            raise CommandError('load some data first, e.g. manage.py loaddata or gen_data')
+
+        paths = ['ads/', f'ads/{advert.pk}/', 'cat/', f'cat/{category.pk}/', 'user/', f'user/{user.pk}/']
+        # The response cache would turn the sync side into a cache benchmark.
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            for path in paths:
+                self.stdout.write(self.style.MIGRATE_HEADING(path))
+                self.stdout.write(f'  WSGI sync  {self.run_wsgi("/" + path, options)}')
+                self.stdout.write(f'  ASGI async {asyncio.run(self.run_asgi("/async/" + path, options))}')
+
+    def run_wsgi(self, url, options):
+        def worker(count):
+            client, timings = Client(), []
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+                timings.append(time.perf_counter() - started)
+            return timings
+
+        concurrency = options['concurrency']
+        counts = [options['requests'] // concurrency] * concurrency
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = [timing for chunk in pool.map(worker, counts) for timing in chunk]
+        return summary(timings, time.perf_counter() - started)
+
+    async def run_asgi(self, url, options):
+        client, timings = AsyncClient(), []
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                assert response.status_code == 200, (url, response.status_code)
+                timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(options['requests'])))
+        return summary(timings, time.perf_counter() - started)
@@ -0,0 +1,444 @@
+import asyncio
+import http.client
+import io
+import itertools
+import json
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from socketserver import ThreadingMixIn
+from statistics import median
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import URLResolver, get_resolver
+from PIL import Image
+
+from HW.profiling import percentile
+from ads import images, purge
+from ads.models import Advert, Category
+from users.models import Location, User
+
+Request = namedtuple('Request', 'method path body content_type')
+
+BENCH_APPS = ('ads.urls', 'users.urls')
+MODES = ('client', 'wsgi', 'asgi')
+# Streamed exports answer 501 under ASGI, see HW.streaming.
+WSGI_ONLY_ROUTES = ('ads/export/', 'user/export/')
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def endpoint_routes():
+    """Full routes of every URL pattern in ads/urls.py and users/urls.py, e.g. 'user/<int:pk>/'."""
+    routes = []
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver) and getattr(pattern.urlconf_module, '__name__', None) in BENCH_APPS:
+            routes.extend(str(pattern.pattern) + str(sub.pattern) for sub in pattern.url_patterns)
+    return routes
+
+
+def json_request(method, path, data):
+    return Request(method, path, json.dumps(data).encode(), 'application/json')
+
+
+class Fixtures:
+    """Sample ids of existing rows to read, plus rows owned by the benchmark to
+    update and delete. Everything the benchmark creates is named 'bench-...'."""
+
+    samples = 100
+
+    def __init__(self, seed):
+        self.rnd = random.Random(seed)
+        self.names = itertools.count()
+        self.adverts = self.sample_pks(Advert)
+        self.categories = self.sample_pks(Category)
+        self.users = self.sample_pks(User)
+        self.locations = [{'name': name, 'lat': float(lat), 'lng': float(lng)} for name, lat, lng in
+                          Location.objects.filter(pk__in=self.sample_pks(Location)).values_list('name', 'lat', 'lng')]
+        self.words = [name.split()[0] for name in Advert.objects.filter(pk__in=self.adverts)
+                      .values_list('name', flat=True)] or ['котёнок']
+        self.prefixes = sorted({name[:2] for name in Category.objects.filter(pk__in=self.categories)
+                                .values_list('name', flat=True)}) or ['Ко']
+        self.image = self.png()
+        self.author = User.objects.create(username=self.name(), password='bench', first_name='bench', age=30)
+        self.category = Category.objects.create(name=self.name())
+        self.advert = Advert.objects.create(name='bench', author=self.author, price=100, description='bench',
+                                            category=self.category, is_published=True)
+        # Re-priced by ads/bulk_update/; bench rows, so the sample stays untouched.
+        self.bench_adverts = [Advert.objects.create(name='bench', author=self.author, price=100,
+                                                    category=self.category).pk for _ in range(100)]
+        self.doomed = {}
+
+    def sample_pks(self, model):
+        bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            raise CommandError(f'no {model._meta.verbose_name_plural} yet; run gen_data first')
+        pks = {model.objects.filter(pk__gte=self.rnd.randint(bounds['low'], bounds['high']))
+               .values_list('pk', flat=True).first() for _ in range(self.samples)}
+        return sorted(pks - {None})
+
+    def name(self):
+        return f'bench-{next(self.names)}'
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'teal').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def prepare_deletes(self, count):
+        """Rows for the delete endpoints, one per request."""
+        categories = Category.objects.bulk_create(Category(name=self.name()) for _ in range(count))
+        users = [User.objects.create(username=self.name(), password='bench', first_name='bench', age=30)
+                 for _ in range(count)]
+        adverts = [Advert.objects.create(name='bench', author=self.author, price=100, category=self.category)
+                   for _ in range(count)]
+        self.doomed = {'ads': deque(advert.pk for advert in adverts),
+                       'cat': deque(category.pk for category in categories),
+                       'user': deque(user.pk for user in users)}
+
+    def cleanup(self):
+        image = Advert.objects.filter(pk=self.advert.pk).values_list('image', flat=True).first()
+        purge.wait()
+        # Adverts created through the endpoints all belong to bench users.
+        User.all_objects.filter(username__startswith='bench-').delete()
+        Category.all_objects.filter(name__startswith='bench-').delete()
+        if image and not Advert.objects.filter(image=image).exists():
+            images.wait()
+            for name in [image, *images.variant_names(image).values()]:
+                default_storage.delete(name)
+
+    def choice(self, values):
+        return self.rnd.choice(values)
+
+    def sample_ids(self, pks, count=20):
+        return ','.join(map(str, self.rnd.sample(pks, min(count, len(pks)))))
+
+    def user_body(self, username):
+        return {'username': username, 'password': 'bench', 'first_name': 'bench', 'last_name': None,
+                'role': 'member', 'age': 30, 'locations': [self.choice(self.locations)] if self.locations else []}
+
+    def advert_body(self):
+        return {'name': 'bench', 'author': self.author.pk, 'price': self.rnd.randint(1, 10_000),
+                'description': 'bench', 'category': self.category.pk}
+
+    def scenarios(self):
+        """Route -> callable building the next Request for it."""
+        list_queries = ['', 'is_published=true&price_max=5000', f'category={self.categories[0]}', 'cursor=']
+
+        def upload():
+            image = SimpleUploadedFile('bench.png', self.image, content_type='image/png')
+            return encode_multipart(BOUNDARY, {'image': image})
+
+        def location():
+            point = self.choice(self.locations) if self.locations else {'lat': 55.75, 'lng': 37.61}
+            return f'lat={point["lat"]}&lng={point["lng"]}&radius_km=20'
+
+        return {
+            'ads/': lambda: Request('GET', f'/ads/?{self.choice(list_queries)}', b'', None),
+            'ads/<int:pk>/': lambda: Request('GET', f'/ads/{self.choice(self.adverts)}/', b'', None),
+            'ads/batch/': lambda: Request('GET', f'/ads/batch/?ids={self.sample_ids(self.adverts)}', b'', None),
+            'ads/search/': lambda: Request('GET', f'/ads/search/?{urlencode({"q": self.choice(self.words)})}', b'',
+                                           None),
+            'ads/nearby/': lambda: Request('GET', f'/ads/nearby/?{location()}', b'', None),
+            'ads/export/': lambda: Request('GET', '/ads/export/', b'', None),
+            'ads/create/': lambda: json_request('POST', '/ads/create/', self.advert_body()),
+            'ads/bulk/': lambda: json_request('POST', '/ads/bulk/', [self.advert_body() for _ in range(10)]),
+            'ads/bulk_update/': lambda: json_request('POST', '/ads/bulk_update/', {
+                'prices': [{'id': pk, 'price': self.rnd.randint(1, 10_000)} for pk in self.bench_adverts]}),
+            'ads/<int:pk>/update/': lambda: json_request('PATCH', f'/ads/{self.advert.pk}/update/',
+                                                         {'price': self.rnd.randint(1, 10_000)}),
+            'ads/<int:pk>/image/': lambda: Request('POST', f'/ads/{self.advert.pk}/image/', upload(),
+                                                   MULTIPART_CONTENT),
+            'ads/<int:pk>/delete/': lambda: Request('DELETE', f'/ads/{self.doomed["ads"].popleft()}/delete/',
+                                                    b'', None),
+            'cat/': lambda: Request('GET', '/cat/', b'', None),
+            'cat/<int:pk>/': lambda: Request('GET', f'/cat/{self.choice(self.categories)}/', b'', None),
+            'cat/create/': lambda: json_request('POST', '/cat/create/', {'name': self.name()}),
+            'cat/<int:pk>/update/': lambda: json_request('PATCH', f'/cat/{self.category.pk}/update/',
+                                                         {'name': self.name()}),
+            'cat/<int:pk>/delete/': lambda: Request('DELETE', f'/cat/{self.doomed["cat"].popleft()}/delete/',
+                                                    b'', None),
+            'cat/suggest/': lambda: Request('GET', f'/cat/suggest/?{urlencode({"prefix": self.choice(self.prefixes)})}',
+                                            b'', None),
+            'cache/stats/': lambda: Request('GET', '/cache/stats/', b'', None),
+            'user/': lambda: Request('GET', f'/user/?{self.choice(["", "cursor="])}', b'', None),
+            'user/<int:pk>/': lambda: Request('GET', f'/user/{self.choice(self.users)}/', b'', None),
+            'user/batch/': lambda: Request('GET', f'/user/batch/?ids={self.sample_ids(self.users)}', b'', None),
+            'user/export/': lambda: Request('GET', '/user/export/', b'', None),
+            'user/suggest/': lambda: Request('GET', f'/user/suggest/?prefix={self.choice(["gen", "gen1", "gen12"])}',
+                                             b'', None),
+            'user/create/': lambda: json_request('POST', '/user/create/', self.user_body(self.name())),
+            'user/<int:pk>/update/': lambda: json_request('PATCH', f'/user/{self.author.pk}/update/',
+                                                          {'age': self.rnd.randint(18, 90)}),
+            'user/<int:pk>/delete/': lambda: Request('DELETE', f'/user/{self.doomed["user"].popleft()}/delete/',
+                                                     b'', None),
+        }
+
+
+# --- drivers -----------------------------------------------------------------
+# Each returns (status, queries, body) for a Request; queries come from the
+# Server-Timing header added by HW.profiling.
+
+def _queries(server_timing):
+    match = QUERIES_RE.search(server_timing or '')
+    return int(match.group(1)) if match else None
+
+
+def _drain(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+class ClientDriver:
+    """django.test.Client: the full middleware stack without any HTTP."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __call__(self, request):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+        response = client.generic(request.method, request.path, request.body,
+                                  content_type=request.content_type or 'application/octet-stream')
+        _drain(response)
+        return response.status_code, _queries(response.get('Server-Timing'))
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class WSGIDriver:
+    """A threaded wsgiref server on a local port, requested over real sockets."""
+
+    def __init__(self):
+        self.server = make_server('127.0.0.1', 0, WSGIHandler(), server_class=ThreadingWSGIServer,
+                                  handler_class=QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __call__(self, request):
+        conn = http.client.HTTPConnection(*self.server.server_address[:2], timeout=60)
+        try:
+            headers = {'Content-Type': request.content_type} if request.content_type else {}
+            conn.request(request.method, request.path, body=request.body or None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status, _queries(response.getheader('Server-Timing'))
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ASGIDriver:
+    """Django's ASGI application called directly with HTTP scopes, the way an
+    ASGI server would, so request bodies and streaming responses take the real path."""
+
+    def __init__(self):
+        self.app = ASGIHandler()
+
+    async def __call__(self, request):
+        path, _, query = request.path.partition('?')
+        headers = [(b'host', b'testserver')]
+        if request.content_type:
+            headers += [(b'content-type', request.content_type.encode()),
+                        (b'content-length', str(len(request.body)).encode())]
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+                 'method': request.method, 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 0), 'server': ('testserver', 80)}
+        messages = [{'type': 'http.request', 'body': request.body, 'more_body': False}]
+        response = {}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Future()  # the client never disconnects
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.lower(): value for name, value in message['headers']}
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            # Raised while sending the body, after the status line went out.
+            return 500, None
+        server_timing = response['headers'].get(b'server-timing', b'').decode()
+        return response['status'], _queries(server_timing)
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every URL of ads/urls.py and users/urls.py through the test client, '
+            'a local WSGI server and the ASGI handler; prints percentiles and saves JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint and mode')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+        parser.add_argument('--routes', nargs='+', help='only these routes, e.g. ads/ user/<int:pk>/')
+        parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='defaults to bench-<timestamp>.json')
+        parser.add_argument('--compare', default=None, help='earlier results file to compare p95 against')
+
+    def handle(self, *args, **options):
+        fixtures = Fixtures(options['seed'])
+        scenarios = fixtures.scenarios()
+        routes = options['routes'] or endpoint_routes()
+        missing = [route for route in routes if route not in scenarios]
+        if missing:
+            raise CommandError(f'no scenario for {", ".join(missing)}')
+
+        results = {}
+        try:
+            with tempfile.TemporaryDirectory() as profiling_dir, override_settings(
+                ALLOWED_HOSTS=['testserver', '127.0.0.1'], DEBUG=False,
+                PROFILING_ENABLED=True, PROFILING_DIR=profiling_dir,
+                PROFILING_SLOW_MS=float('inf'), PROFILING_SLOW_QUERIES=float('inf'),
+                **({} if options['cache'] else {'RESPONSE_CACHE_TIMEOUT': 0}),
+            ):
+                for mode in options['modes']:
+                    fixtures.prepare_deletes(options['requests'] + options['warmup'])
+                    self.stdout.write(self.style.MIGRATE_HEADING(mode))
+                    results[mode] = self.run_mode(mode, routes, scenarios, options)
+        finally:
+            fixtures.cleanup()
+
+        report = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'commit': self.git_commit(),
+            'database': connection.vendor,
+            'rows': {'ads': Advert.objects.count(), 'categories': Category.objects.count(),
+                     'users': User.objects.count(), 'locations': Location.objects.count()},
+            'options': {name: options[name] for name in ('requests', 'warmup', 'concurrency', 'cache')},
+            'results': results,
+        }
+        output = options['output'] or f'bench-{datetime.now():%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as stream:
+            json.dump(report, stream, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'saved {output}'))
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def run_mode(self, mode, routes, scenarios, options):
+        results = {}
+        driver = {'client': ClientDriver, 'wsgi': WSGIDriver, 'asgi': ASGIDriver}[mode]()
+        try:
+            for route in routes:
+                build = scenarios[route]
+                if mode == 'asgi' and route in WSGI_ONLY_ROUTES:
+                    continue
+                if mode == 'asgi':
+                    asyncio.run(self.run_async(driver, build, options['warmup'], 1))
+                    samples, elapsed = asyncio.run(self.run_async(driver, build, options['requests'],
+                                                                  options['concurrency']))
+                else:
+                    self.run_sync(driver, build, options['warmup'], 1)
+                    samples, elapsed = self.run_sync(driver, build, options['requests'], options['concurrency'])
+                results[route] = self.summarize(samples, elapsed)
+                self.stdout.write(self.format_row(route, results[route]))
+        finally:
+            driver.close()
+        return results
+
+    def run_sync(self, driver, build, count, concurrency):
+        def one(_):
+            request = build()
+            started = time.perf_counter()
+            status, queries = driver(request)
+            return time.perf_counter() - started, status, queries
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            samples = [one(i) for i in range(count)]
+        else:
+            with ThreadPoolExecutor(concurrency) as pool:
+                samples = list(pool.map(one, range(count)))
+        return samples, time.perf_counter() - started
+
+    async def run_async(self, driver, build, count, concurrency):
+        semaphore, samples = asyncio.Semaphore(concurrency), []
+
+        async def one():
+            async with semaphore:
+                request = build()
+                started = time.perf_counter()
+                status, queries = await driver(request)
+                samples.append((time.perf_counter() - started, status, queries))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(count)))
+        return samples, time.perf_counter() - started
+
+    def summarize(self, samples, elapsed):
+        timings = [timing * 1000 for timing, _, _ in samples]
+        queries = [count for _, _, count in samples if count is not None]
+        errors = Counter(str(status) for _, status, _ in samples if status >= 400)
+        return {'requests': len(samples),
+                'errors': sum(errors.values()),
+                'error_statuses': dict(errors),
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'rps': round(len(samples) / elapsed, 1) if elapsed else None,
+                'queries': median(queries) if queries else None,
+                }
+
+    def format_row(self, route, row):
+        errors = self.style.ERROR(f'  errors {row["error_statuses"]}') if row['errors'] else ''
+        return (f'  {route:28} p50 {row["p50_ms"]:8.2f}  p95 {row["p95_ms"]:8.2f}  p99 {row["p99_ms"]:8.2f} ms'
+                f'  {row["rps"]:8.1f} req/s  {row["queries"]} queries{errors}')
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, report):
+        with open(path) as stream:
+            previous = json.load(stream)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'p95 against {path} ({previous.get("commit")})'))
+        for mode, rows in report['results'].items():
+            for route, row in rows.items():
+                before = previous['results'].get(mode, {}).get(route)
+                if before is None:
+                    continue
+                change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+                self.stdout.write(f'  {mode:6} {route:28} {before["p95_ms"]:8.2f} -> {row["p95_ms"]:8.2f} ms '
+                                  f'({change:+.0f}%)  queries {before["queries"]} -> {row["queries"]}')
@@ -0,0 +1,70 @@
+import random
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from HW import settings
+from ads.filters import filter_adverts
+from ads.models import Advert, Category
+from users.models import User
+
+SCENARIOS = [
+    '',
+    'is_published=true',
+    'is_published=true&price_min=1000&price_max=5000',
+    'category={category}',
+    'category={category}&price_max=1000',
+    'author={author}',
+]
+
+
+class Command(BaseCommand):
+    help = 'Show query plans and timings of the advert list filters on a synthetic dataset (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            category, author = self.seed(options['rows'], options['batch_size'])
+            for scenario in SCENARIOS:
+                self.run(scenario.format(category=category.pk, author=author.pk), options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, rows, batch_size):
+        rnd = random.Random(0)
+        authors = User.objects.bulk_create(
+            User(first_name='bench', username=f'bench-{i}', password='bench', age=30) for i in range(1000)
+        )
+        categories = Category.objects.bulk_create(Category(name=f'bench-{i}') for i in range(20))
+
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            Advert.objects.bulk_create(
+                Advert(name='bench', author=rnd.choice(authors), price=rnd.randint(1, 100_000),
+                       is_published=rnd.random() < 0.7, category=rnd.choice(categories))
+                for _ in range(min(batch_size, rows - offset))
+            )
+        self.stdout.write(f'seeded {rows} adverts in {time.perf_counter() - started:.1f}s')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return categories[0], authors[0]
+
+    def run(self, scenario, repeat):
+        queryset = filter_adverts(Advert.objects.order_by('price', 'id'), QueryDict(scenario))
+        page = queryset[:settings.TOTAL_ON_PAGE]
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(page.all())
+            timings.append(time.perf_counter() - started)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'?{scenario}  median {median(timings) * 1000:.3f} ms'))
+        self.stdout.write(page.explain())
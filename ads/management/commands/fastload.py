@@ -0,0 +1,253 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import pre_save
+
+from HW.cache import invalidate_namespace
+from ads import counters
+from ads.models import Advert
+from ads.search import search_index
+from ads.suggest import category_index
+from users.suggest import username_index
+
+COPY_NULL = r'\N'
+
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without reading it whole."""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('expected a JSON array')
+                started, position = True, position + 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break  # incomplete element: read more
+            yield record
+        if not chunk:
+            raise CommandError('unexpected end of JSON array')
+
+
+def iter_records(path):
+    with open(path, encoding='utf-8') as stream:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(stream)
+
+
+def insert(connection, model, objs):
+    """Insert objs with COPY on PostgreSQL and bulk_create elsewhere; no signals are sent."""
+    if connection.vendor != 'postgresql':
+        model._default_manager.using(connection.alias).bulk_create(objs)
+        return
+
+    fields = [field for field in model._meta.concrete_fields
+              if not (field.primary_key and getattr(objs[0], field.attname) is None)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objs:
+        row = []
+        for field in fields:
+            value = field.get_db_prep_save(field.pre_save(obj, True), connection)
+            row.append(COPY_NULL if value is None else value)
+        writer.writerow(row)
+    buffer.seek(0)
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    sql = f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(sql, buffer)
+
+
+def reset_sequences(connection, models):
+    """Move the id sequences past rows inserted with explicit primary keys."""
+    models = list(models)
+    for model in list(models):
+        models.extend(field.remote_field.through for field in model._meta.local_many_to_many)
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+class Command(BaseCommand):
+    help = 'Load large fixture files (JSON array or NDJSON, loaddata format) with COPY or bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='fixtures in dependency order, e.g. location, user, category, ad')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--restart', action='store_true', help='ignore saved progress and load from the start')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.connection = connections[self.using]
+        self.known_pks = {}
+        self.loaded_models = set()
+
+        for path in options['files']:
+            self.load_file(path, options['batch_size'], options['restart'])
+
+        # Progress is kept until every file is in, so a rerun after a failure
+        # in a later file doesn't read the earlier ones again. It is saved after
+        # each batch commits; rows of a batch committed just before a crash are
+        # recognised by their primary key and not loaded twice.
+        for path in options['files']:
+            os.remove(self.progress_path(path))
+
+        reset_sequences(self.connection, self.loaded_models)
+        # Nothing below was saved through the ORM, so no signals purged these.
+        invalidate_namespace('ads:list')
+        invalidate_namespace('cat:list')
+        search_index.clear()
+        category_index.clear()
+        username_index.clear()
+
+    # --- progress -------------------------------------------------------
+
+    def progress_path(self, path):
+        return f'{path}.fastload-progress'
+
+    def read_progress(self, path, restart):
+        if restart or not os.path.exists(self.progress_path(path)):
+            return 0
+        with open(self.progress_path(path)) as stream:
+            return json.load(stream)['records']
+
+    def write_progress(self, path, records):
+        tmp_path = f'{self.progress_path(path)}.tmp'
+        with open(tmp_path, 'w') as stream:
+            json.dump({'records': records}, stream)
+        os.replace(tmp_path, self.progress_path(path))
+
+    # --- loading --------------------------------------------------------
+
+    def load_file(self, path, batch_size, restart):
+        done = self.read_progress(path, restart)
+        if done:
+            self.stdout.write(f'{path}: resuming after {done} records')
+
+        started, loaded, skipped = time.perf_counter(), 0, []
+        batch = []
+        for position, record in enumerate(iter_records(path)):
+            if position < done:
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                skipped += self.write_batch(batch)
+                loaded += len(batch)
+                self.write_progress(path, done + loaded)
+                self.report(path, loaded, started)
+                batch = []
+        if batch:
+            skipped += self.write_batch(batch)
+            loaded += len(batch)
+        self.write_progress(path, done + loaded)
+
+        self.report(path, loaded, started, final=True)
+        for pk, reason in skipped[:20]:
+            self.stderr.write(f'  skipped pk={pk}: {reason}')
+        if len(skipped) > 20:
+            self.stderr.write(f'  ... {len(skipped) - 20} more skipped')
+
+    def report(self, path, loaded, started, final=False):
+        elapsed = time.perf_counter() - started
+        rate = loaded / elapsed if elapsed else 0
+        style = self.style.SUCCESS if final else (lambda text: text)
+        self.stdout.write(style(f'{path}: {loaded} records, {elapsed:.1f}s, {rate:,.0f} rows/s'))
+
+    def pks_of(self, model):
+        # Existing primary keys of a referenced model, plus the ones loaded so far.
+        if model not in self.known_pks:
+            self.known_pks[model] = set(
+                model._default_manager.using(self.using).values_list('pk', flat=True).iterator()
+            )
+        return self.known_pks[model]
+
+    def resolve(self, obj, m2m_data):
+        """Return the reason a row can't be loaded, or None."""
+        for field in obj._meta.concrete_fields:
+            if field.is_relation:
+                value = getattr(obj, field.attname)
+                if value is not None and value not in self.pks_of(field.related_model):
+                    return f'{field.name}={value} does not exist'
+        for name, pks in m2m_data.items():
+            field = obj._meta.get_field(name)
+            missing = set(pks) - self.pks_of(field.related_model)
+            if missing:
+                return f'{name} {sorted(missing)} do not exist'
+        return None
+
+    def existing_pks(self, deserialized_objects):
+        pks = defaultdict(set)
+        for deserialized in deserialized_objects:
+            if deserialized.object.pk is not None:
+                pks[type(deserialized.object)].add(deserialized.object.pk)
+        return {model: set(model._base_manager.using(self.using).filter(pk__in=batch).values_list('pk', flat=True))
+                for model, batch in pks.items()}
+
+    def write_batch(self, records):
+        objects, m2m_data, skipped = defaultdict(list), [], []
+        deserialized_objects = list(Deserializer(records, using=self.using))
+        existing = self.existing_pks(deserialized_objects)
+        for deserialized in deserialized_objects:
+            obj = deserialized.object
+            model = type(obj)
+            if obj.pk in existing.get(model, ()):
+                # Committed by a run that stopped before it could save its progress.
+                continue
+            reason = self.resolve(obj, deserialized.m2m_data)
+            if reason:
+                skipped.append((obj.pk, reason))
+                continue
+            # Same signal loaddata sends; fills geohash and updated_at.
+            pre_save.send(sender=model, instance=obj, raw=True, using=self.using, update_fields=None)
+            objects[model].append(obj)
+            if deserialized.m2m_data:
+                m2m_data.append((obj, deserialized.m2m_data))
+
+        with transaction.atomic(using=self.using):
+            for model, objs in objects.items():
+                insert(self.connection, model, objs)
+            if Advert in objects:
+                counters.apply([], [counters.counted_state(advert) for advert in objects[Advert]], self.using)
+
+            m2m_rows = defaultdict(list)
+            for obj, data in m2m_data:
+                for name, pks in data.items():
+                    field = obj._meta.get_field(name)
+                    through = field.remote_field.through
+                    source, target = field.m2m_field_name() + '_id', field.m2m_reverse_field_name() + '_id'
+                    m2m_rows[through].extend(through(**{source: obj.pk, target: pk}) for pk in pks)
+            for through, rows in m2m_rows.items():
+                insert(self.connection, through, rows)
+
+        for model, objs in objects.items():
+            self.pks_of(model).update(obj.pk for obj in objs)
+            self.loaded_models.add(model)
+        return skipped
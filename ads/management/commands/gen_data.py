@@ -0,0 +1,206 @@
+import math
+import os
+import random
+import time
+from bisect import bisect
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.db.models.signals import pre_save
+
+from HW.cache import invalidate_namespace
+from ads import counters
+from ads.management.commands.fastload import insert, reset_sequences
+from ads.models import Advert, Category
+from ads.search import search_index
+from ads.suggest import category_index
+from users.models import Location, User
+from users.suggest import username_index
+
+# (city, lat, lng); earlier cities get more users, roughly like population.
+CITIES = [
+    ('Москва', 55.7558, 37.6173), ('Санкт-Петербург', 59.9386, 30.3141), ('Новосибирск', 55.0084, 82.9357),
+    ('Екатеринбург', 56.8389, 60.6057), ('Казань', 55.7963, 49.1088), ('Нижний Новгород', 56.3269, 44.0059),
+    ('Челябинск', 55.1644, 61.4368), ('Самара', 53.1959, 50.1002), ('Омск', 54.9885, 73.3242),
+    ('Ростов-на-Дону', 47.2357, 39.7015), ('Уфа', 54.7388, 55.9721), ('Красноярск', 56.0153, 92.8932),
+    ('Воронеж', 51.6720, 39.1843), ('Пермь', 58.0105, 56.2502), ('Волгоград', 48.7080, 44.5133),
+    ('Краснодар', 45.0355, 38.9753), ('Тюмень', 57.1522, 65.5272), ('Иркутск', 52.2870, 104.3050),
+    ('Владивосток', 43.1155, 131.8855), ('Тверь', 56.8587, 35.9176),
+]
+CATEGORIES = ['Котики', 'Песики', 'Книги', 'Одежда', 'Электроника', 'Мебель', 'Детские товары', 'Спорт',
+              'Авто', 'Недвижимость', 'Хобби', 'Музыка', 'Инструменты', 'Растения', 'Услуги', 'Работа',
+              'Билеты', 'Посуда', 'Антиквариат', 'Птицы']
+FIRST_NAMES = ['Иван', 'Пётр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена', 'Сергей', 'Наталья',
+               'Андрей', 'Татьяна', 'Михаил', 'Ирина', 'Николай', 'Светлана']
+LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов', 'Новиков']
+ADJECTIVES = ['Новый', 'Отличный', 'Редкий', 'Старинный', 'Красивый', 'Большой', 'Маленький', 'Удобный',
+              'Срочно', 'Недорого', 'Почти новый', 'Винтажный']
+NOUNS = ['котёнок', 'щенок', 'диван', 'велосипед', 'телефон', 'ноутбук', 'шкаф', 'самокат', 'фотоаппарат',
+         'комод', 'аквариум', 'попугай', 'пылесос', 'гитара', 'холодильник', 'стол', 'пальто', 'коляска']
+WORDS = ['продаю', 'в', 'отличном', 'состоянии', 'торг', 'уместен', 'самовывоз', 'доставка', 'возможна',
+         'без', 'дефектов', 'срочно', 'цена', 'за', 'штуку', 'пишите', 'в', 'личку', 'звоните', 'после',
+         'ремонта', 'гарантия', 'документы', 'есть', 'очень', 'милые', 'и', 'ручные', 'кушают', 'корм']
+
+
+def zipf_cum_weights(size, exponent):
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+class Sampler:
+    """Draws items with Zipf-distributed popularity, the first item being the
+    most popular. Shuffle so that popularity doesn't follow primary key order."""
+
+    def __init__(self, rnd, items, exponent, shuffle=True):
+        self.items = list(items)
+        if shuffle:
+            rnd.shuffle(self.items)
+        self.cum_weights = zipf_cum_weights(len(self.items), exponent)
+        self.rnd = rnd
+
+    def __call__(self):
+        return self.items[bisect(self.cum_weights, self.rnd.random() * self.cum_weights[-1])]
+
+
+class Command(BaseCommand):
+    help = 'Generate skewed synthetic categories, locations, users and adverts, e.g. --ads 1000000 --users 50000'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--categories', type=int, default=len(CATEGORIES))
+        parser.add_argument('--locations', type=int, default=None, help='defaults to users / 10, at least 100')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['ads'] and not (options['users'] or User.objects.using(options['database']).exists()):
+            raise CommandError('adverts need authors: pass --users')
+        self.connection = connections[options['database']]
+        self.using = options['database']
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.images = self.image_pool()
+
+        category_ids = self.gen_categories(options['categories'])
+        location_ids = self.gen_locations(options['locations'] or max(100, options['users'] // 10))
+        user_ids = self.gen_users(options['users'], location_ids)
+        self.gen_adverts(options['ads'], user_ids, category_ids)
+
+        reset_sequences(self.connection, [Category, Location, User, Advert])
+        if self.connection.vendor == 'postgresql':
+            with self.connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        invalidate_namespace('ads:list')
+        invalidate_namespace('cat:list')
+        search_index.clear()
+        category_index.clear()
+        username_index.clear()
+
+    def image_pool(self):
+        # References to the sample pictures shipped in MEDIA_ROOT.
+        try:
+            names = os.listdir(os.path.join(settings.MEDIA_ROOT, 'images'))
+        except OSError:
+            return []
+        return sorted(f'images/{name}' for name in names if name.startswith('post'))
+
+    def next_pk(self, model):
+        return (model._default_manager.using(self.using).aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+    def write(self, model, objs):
+        for obj in objs:
+            # Same signal loaddata sends; fills geohash and updated_at.
+            pre_save.send(sender=model, instance=obj, raw=True, using=self.using, update_fields=None)
+        insert(self.connection, model, objs)
+
+    def batches(self, label, total, build):
+        started, done = time.perf_counter(), 0
+        while done < total:
+            size = min(self.batch_size, total - done)
+            with transaction.atomic(using=self.using):
+                build(done, size)
+            done += size
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{label}: {done}/{total}, {done / elapsed:,.0f} rows/s')
+
+    # --- generators -----------------------------------------------------
+
+    def gen_categories(self, count):
+        existing = set(Category.objects.using(self.using).values_list('name', flat=True))
+        start, categories = self.next_pk(Category), []
+        for position in range(count):
+            base = CATEGORIES[position % len(CATEGORIES)]
+            name = base if base not in existing else f'{base} {start + position}'
+            existing.add(name)
+            categories.append(Category(pk=start + position, name=name))
+        if categories:
+            with transaction.atomic(using=self.using):
+                self.write(Category, categories)
+        return list(Category.objects.using(self.using).values_list('pk', flat=True))
+
+    def gen_locations(self, count):
+        start, rnd = self.next_pk(Location), self.rnd
+        cities = Sampler(rnd, CITIES, 1.0, shuffle=False)
+
+        def build(offset, size):
+            locations = []
+            for pk in range(start + offset, start + offset + size):
+                city, lat, lng = cities()
+                # Within ~15 km of the centre.
+                locations.append(Location(pk=pk, name=f'{city}, район {pk}',
+                                          lat=round(lat + rnd.uniform(-0.13, 0.13), 6),
+                                          lng=round(lng + rnd.uniform(-0.2, 0.2), 6)))
+            self.write(Location, locations)
+
+        self.batches('locations', count, build)
+        return list(Location.objects.using(self.using).values_list('pk', flat=True))
+
+    def gen_users(self, count, location_ids):
+        start, rnd = self.next_pk(User), self.rnd
+        locations = Sampler(rnd, location_ids, 0.8)
+        through = User.locations.through
+
+        def build(offset, size):
+            users, links = [], []
+            for pk in range(start + offset, start + offset + size):
+                users.append(User(pk=pk, username=f'gen{pk}', password='secret',
+                                  first_name=rnd.choice(FIRST_NAMES),
+                                  last_name=rnd.choice(LAST_NAMES) if rnd.random() < 0.8 else None,
+                                  role=rnd.choices(['member', 'moderator', 'admin'], [90, 8, 2])[0],
+                                  age=min(90, 18 + int(rnd.gammavariate(2, 8)))))
+                for location_id in {locations() for _ in range(rnd.choices([1, 2, 3], [70, 20, 10])[0])}:
+                    links.append(through(user_id=pk, location_id=location_id))
+            self.write(User, users)
+            insert(self.connection, through, links)
+
+        self.batches('users', count, build)
+        return list(User.objects.using(self.using).values_list('pk', flat=True))
+
+    def gen_adverts(self, count, user_ids, category_ids):
+        start, rnd = self.next_pk(Advert), self.rnd
+        # A few heavy sellers and a long tail of one-off ones.
+        authors = Sampler(rnd, user_ids, 1.1)
+        categories = Sampler(rnd, category_ids, 1.0) if category_ids else (lambda: None)
+
+        def build(offset, size):
+            adverts = []
+            for pk in range(start + offset, start + offset + size):
+                price = min(10 ** 8, round(math.exp(rnd.gauss(math.log(3000), 1.2)), -1))
+                adverts.append(Advert(
+                    pk=pk,
+                    name=f'{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)}',
+                    author_id=authors(),
+                    price=price,
+                    description=' '.join(rnd.choices(WORDS, k=min(120, int(rnd.paretovariate(1.5) * 8)))).capitalize(),
+                    is_published=rnd.random() < 0.75,
+                    image=rnd.choice(self.images) if self.images and rnd.random() < 0.9 else None,
+                    category_id=categories() if rnd.random() < 0.97 else None,
+                ))
+            self.write(Advert, adverts)
+            counters.apply([], [counters.counted_state(advert) for advert in adverts], self.using)
+
+        self.batches('adverts', count, build)
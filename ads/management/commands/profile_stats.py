@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from HW.profiling import load_windows, percentile
+
+
+def summarize(samples):
+    totals, db, queries = zip(*samples)
+    return {'count': len(samples),
+            'p50_ms': percentile(totals, 0.5),
+            'p95_ms': percentile(totals, 0.95),
+            'p99_ms': percentile(totals, 0.99),
+            'p95_db_ms': percentile(db, 0.95),
+            'p95_queries': percentile(queries, 0.95),
+            'max_queries': max(queries),
+            }
+
+
+class Command(BaseCommand):
+    help = 'Show rolling per-URL-pattern latency percentiles collected by HW.profiling.ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=None,
+                            help='ignore workers that have not flushed for this many seconds')
+        parser.add_argument('--sort', choices=['p95_ms', 'p99_ms', 'count', 'p95_queries'], default='p95_ms')
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        stats = {pattern: summarize(samples) for pattern, samples in load_windows(options['max_age']).items()}
+        rows = sorted(stats.items(), key=lambda item: item[1][options['sort']], reverse=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(dict(rows), indent=2))
+            return
+        if not rows:
+            self.stdout.write('no samples; is PROFILING_ENABLED set?')
+            return
+
+        self.stdout.write(f'{"pattern":40} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} '
+                          f'{"p95 db":>9} {"p95 q":>6} {"max q":>6}')
+        for pattern, row in rows:
+            self.stdout.write(f'{pattern:40} {row["count"]:7} {row["p50_ms"]:9.2f} {row["p95_ms"]:9.2f} '
+                              f'{row["p99_ms"]:9.2f} {row["p95_db_ms"]:9.2f} {row["p95_queries"]:6} '
+                              f'{row["max_queries"]:6}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from ads.purge import purge
+
+
+class Command(BaseCommand):
+    help = 'Remove the adverts of deleted users and detach deleted categories, then delete both, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='defaults to PURGE_BATCH_SIZE')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        users, categories = purge(options['batch_size'], options['database'])
+        self.stdout.write(self.style.SUCCESS(f'purged {users} users and {categories} categories'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from ads.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Recompute User.published_adverts_count and Category.adverts_count where they drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        users, categories = recount(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'fixed {users} users and {categories} categories'))
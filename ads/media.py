@@ -0,0 +1,134 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+
+from ads import images
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single-range `Range` header.
+
+    None means the whole file: no header, a malformed one, or several ranges,
+    which may be answered in full. An unsatisfiable range raises ValueError.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        start, end = max(0, size - int(last)), size - 1
+        if int(last) == 0:
+            raise ValueError('empty suffix range')
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            if last and int(last) < start:
+                return None
+            raise ValueError('range starts past the end')
+    return start, end
+
+
+class FileRange:
+    """Read at most `length` bytes of an open file from `start`.
+
+    Keeps fileno() so a WSGI server's file_wrapper can still sendfile() it:
+    the descriptor is positioned at `start` and Content-Length bounds the copy.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class MediaView(View):
+    """Serve MEDIA_ROOT files with validators, single ranges and long-lived caching.
+
+    Content-hashed images and their variants never change under the same name,
+    so they are cached as immutable. With MEDIA_OFFLOAD set, the body is left
+    to the front proxy via X-Accel-Redirect (nginx) or X-Sendfile (Apache).
+    """
+    http_method_names = ['get', 'head']
+
+    def get(self, request, name):
+        try:
+            path = safe_join(settings.MEDIA_ROOT, name)
+            file_stat = os.stat(path)
+        except (SuspiciousFileOperation, OSError):
+            raise Http404('no such file')
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise Http404('no such file')
+
+        etag = quote_etag(f'{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}')
+        headers = {'ETag': etag, 'Last-Modified': http_date(file_stat.st_mtime)}
+        if images.is_immutable(name):
+            headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            headers['Cache-Control'] = f'public, max-age={settings.MEDIA_MAX_AGE}'
+
+        response = get_conditional_response(request, etag, int(file_stat.st_mtime))
+        if response is None:
+            response = self.body_response(request, name, path, file_stat.st_size, etag)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def body_response(self, request, name, path, size, etag):
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+            # The proxy answers Range itself.
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+            return response
+        if settings.MEDIA_OFFLOAD == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+            return response
+
+        file_range = None
+        # A stale If-Range means the client's partial copy is outdated: send it all.
+        if request.headers.get('If-Range', etag) == etag:
+            try:
+                file_range = parse_range(request.headers.get('Range'), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        file = open(path, 'rb')
+        if file_range is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = file_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        return response
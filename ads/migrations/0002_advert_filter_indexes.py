@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(fields=['price', 'id'], name='advert_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(fields=['is_published', 'price', 'id'], name='advert_published_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(fields=['category', 'price', 'id'], name='advert_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(fields=['author', 'price', 'id'], name='advert_author_price_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:00
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SQL = """
+CREATE FUNCTION ads_advert_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ads_advert_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description, search_vector ON ads_advert
+    FOR EACH ROW EXECUTE PROCEDURE ads_advert_search_vector_update();
+
+UPDATE ads_advert SET search_vector = NULL;
+
+CREATE INDEX advert_search_vector_idx ON ads_advert USING gin (search_vector);
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS advert_search_vector_idx;
+DROP TRIGGER IF EXISTS ads_advert_search_vector_trigger ON ads_advert;
+DROP FUNCTION IF EXISTS ads_advert_search_vector_update();
+"""
+
+
+def run_on_postgres(sql):
+    # Other backends (the SQLite test runs) search through ads.search.InvertedIndex.
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0002_advert_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advert',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgres(CREATE_SQL), run_on_postgres(DROP_SQL)),
+    ]
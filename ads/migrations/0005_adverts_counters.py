@@ -0,0 +1,35 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Advert = apps.get_model('ads', 'Advert')
+    Category = apps.get_model('ads', 'Category')
+    User = apps.get_model('users', 'User')
+
+    def count(group_by, **filters):
+        adverts = Advert.objects.filter(**{group_by: OuterRef('pk')}, **filters).order_by().values(group_by)
+        return Coalesce(Subquery(adverts.annotate(count=Count('id')).values('count')), Value(0))
+
+    User.objects.update(published_adverts_count=count('author', is_published=True))
+    Category.objects.update(adverts_count=count('category'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0004_updated_at'),
+        ('users', '0004_adverts_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='adverts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
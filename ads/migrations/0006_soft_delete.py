@@ -0,0 +1,34 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_soft_delete'),
+        ('ads', '0005_adverts_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='advert',
+            name='author',
+            field=models.ForeignKey(limit_choices_to={'is_deleted': False}, on_delete=django.db.models.deletion.CASCADE, to='users.user'),
+        ),
+        migrations.AlterField(
+            model_name='advert',
+            name='category',
+            field=models.ForeignKey(limit_choices_to={'is_deleted': False}, null=True, on_delete=django.db.models.deletion.SET_NULL, to='ads.category'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['id'], name='category_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:59
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0006_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='advert',
+            name='description',
+            field=models.TextField(max_length=1000, null=True, validators=[django.core.validators.MaxLengthValidator(1000)]),
+        ),
+    ]
@@ -1,9 +1,23 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxLengthValidator
+from django.db import models, router, transaction
+from django.db.models import Q
+
+from HW.models import CounterFieldsMixin, SoftDeleteManager
 from users.models import User
 
 
-class Category(models.Model):
+class Category(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=50, unique=True)
+    adverts_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Set by the delete endpoint; ads.purge detaches the adverts and then deletes the row.
+    is_deleted = models.BooleanField(default=False, editable=False)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    counter_fields = ('adverts_count',)
 
     def __str__(self):
         return self.name
@@ -11,26 +25,58 @@ class Category(models.Model):
     class Meta():
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
+        indexes = [
+            models.Index(fields=['id'], name='category_deleted_idx', condition=Q(is_deleted=True)),
+        ]
+
+
+class AdvertManager(models.Manager):
+    """Hides the adverts of deleted users until the purger removes them.
+
+    Deleted users are few and found through their partial index, so this is
+    a small NOT IN rather than a join to every author.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().exclude(author_id__in=User.objects.hidden().values('pk'))
+
+    def hidden(self):
+        """The rows get_queryset() leaves out, until the purger catches up."""
+        return super().get_queryset().filter(author_id__in=User.objects.hidden().values('pk'))
 
 
 class Advert(models.Model):
     name = models.CharField(max_length=250)
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'is_deleted': False})
     price = models.DecimalField(max_digits=11, decimal_places=2)
-    description = models.TextField(max_length=1000, null=True)
+    # max_length alone only limits form fields.
+    description = models.TextField(max_length=1000, null=True, validators=[MaxLengthValidator(1000)])
     is_published = models.BooleanField(default=False)
     image = models.ImageField(upload_to='images/', null=True)
-    category = models.ForeignKey(Category, null=True, on_delete=models.SET_NULL)
+    category = models.ForeignKey(Category, null=True, on_delete=models.SET_NULL,
+                                 limit_choices_to={'is_deleted': False})
+    # Maintained by a Postgres trigger (see migration 0003); unused elsewhere.
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = AdvertManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # The counter updates in ads.signals run in this transaction.
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
     class Meta():
         verbose_name = 'Объявление'
         verbose_name_plural = 'Объявления'
-
-
-
-
-
-
+        indexes = [
+            models.Index(fields=['price', 'id'], name='advert_price_idx'),
+            models.Index(fields=['is_published', 'price', 'id'], name='advert_published_price_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='advert_category_price_idx'),
+            models.Index(fields=['author', 'price', 'id'], name='advert_author_price_idx'),
+        ]
@@ -0,0 +1,92 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.functions import Now
+
+from HW.cache import invalidate_keys, invalidate_namespace
+from ads import counters
+from ads.cache import advert_detail_key
+from ads.models import Advert, Category
+from ads.search import search_index
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# One worker: purges are sequential and never compete with each other for rows.
+_executor = None
+
+
+def _batches(adverts, batch_size, using, deleting):
+    """Yield, each in its own transaction, locked batches of the adverts still matching."""
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(adverts.using(using).select_for_update().order_by('pk')
+                        .values_list('pk', 'author_id', 'category_id', 'is_published')[:batch_size])
+            if not rows:
+                return
+            yield rows
+        advert_ids = [row[0] for row in rows]
+        invalidate_keys([advert_detail_key(None, pk) for pk in advert_ids])
+        invalidate_namespace('ads:list')
+        if deleting:
+            for pk in advert_ids:
+                search_index.remove(pk)
+
+
+def purge_user(user_id, batch_size, using=DEFAULT_DB_ALIAS):
+    """Delete a deleted user's adverts batch by batch, then the user."""
+    for rows in _batches(Advert.all_objects.filter(author_id=user_id), batch_size, using, deleting=True):
+        # Adverts have no dependents, and the per-row delete signals are done
+        # here once per batch, so skip the collector.
+        Advert.all_objects.filter(pk__in=[row[0] for row in rows])._raw_delete(using)
+        counters.apply([row[1:] for row in rows], [], using)
+    User.all_objects.using(using).filter(pk=user_id, is_deleted=True).delete()
+
+
+def purge_category(category_id, batch_size, using=DEFAULT_DB_ALIAS):
+    """Detach a deleted category from its adverts batch by batch, then delete it."""
+    for rows in _batches(Advert.all_objects.filter(category_id=category_id), batch_size, using,
+                         deleting=False):
+        Advert.all_objects.using(using).filter(pk__in=[row[0] for row in rows])\
+            .update(category=None, updated_at=Now())
+    Category.all_objects.using(using).filter(pk=category_id, is_deleted=True).delete()
+
+
+def purge(batch_size=None, using=DEFAULT_DB_ALIAS):
+    """Purge every user and category flagged is_deleted; return how many of each."""
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    done = []
+    for model, purge_one in ((User, purge_user), (Category, purge_category)):
+        pks = list(model.all_objects.using(using).filter(is_deleted=True).values_list('pk', flat=True))
+        for pk in pks:
+            purge_one(pk, batch_size, using)
+        done.append(len(pks))
+    return tuple(done)
+
+
+def _run():
+    try:
+        purge()
+    except Exception:
+        # The rows stay flagged; the next schedule() or `manage.py purge_deleted` retries.
+        logger.exception('purge failed')
+    finally:
+        connections.close_all()
+
+
+def schedule():
+    """Purge in the background; call after the soft delete commits."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+    return _executor.submit(_run)
+
+
+def wait():
+    """Block until scheduled purges finish; the next schedule() starts a new worker."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
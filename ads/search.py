@@ -0,0 +1,153 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+from ads.models import Advert
+
+SEARCH_CONFIG = 'russian'
+
+WORD_RE = re.compile(r'\w+')
+# Common Russian noun and adjective endings, longest first.
+SUFFIXES = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ым', 'им', 'ую', 'юю',
+    'ах', 'ях', 'ам', 'ям', 'ом', 'ем',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+], key=len, reverse=True)
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+
+
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall((text or '').lower().replace('ё', 'е'))]
+
+
+class InvertedIndex:
+    """Process-local full-text index used when the database isn't Postgres.
+
+    Maps each stemmed term to {advert_id: weight}. Built from the database on
+    first use and kept current from Advert signals afterwards.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._lock = threading.Lock()
+        self.built = False
+
+    def _weights(self, name, description):
+        weights = defaultdict(float)
+        for term in tokenize(name):
+            weights[term] += NAME_WEIGHT
+        for term in tokenize(description):
+            weights[term] += DESCRIPTION_WEIGHT
+        return weights
+
+    def _remove(self, advert_id):
+        for term in self._terms.pop(advert_id, ()):
+            postings = self._postings[term]
+            postings.pop(advert_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def _add(self, advert_id, name, description):
+        weights = self._weights(name, description)
+        for term, weight in weights.items():
+            self._postings[term][advert_id] = weight
+        self._terms[advert_id] = set(weights)
+
+    def build(self, using='default'):
+        with self._lock:
+            if self.built:
+                return
+            rows = Advert.objects.using(using).values_list('id', 'name', 'description').iterator()
+            for advert_id, name, description in rows:
+                self._add(advert_id, name, description)
+            self.built = True
+
+    def update(self, advert):
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(advert.pk)
+            self._add(advert.pk, advert.name, advert.description)
+
+    def remove(self, advert_id):
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(advert_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._terms.clear()
+            self.built = False
+
+    def search(self, query):
+        """Return {advert_id: score} for adverts containing every query term."""
+        terms = set(tokenize(query))
+        if not terms:
+            return {}
+        with self._lock:
+            postings = [self._postings.get(term, {}) for term in terms]
+            postings.sort(key=len)
+            scores = dict(postings[0])
+            for other in postings[1:]:
+                scores = {advert_id: score + other[advert_id]
+                          for advert_id, score in scores.items() if advert_id in other}
+        return scores
+
+
+search_index = InvertedIndex()
+
+
+def _search_query(query):
+    return SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def ranks_in_database(queryset):
+    """Whether search_adverts() can rank in SQL; otherwise page over search_keys()."""
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def match_adverts(queryset, query):
+    """Filter queryset to adverts matching query, without ranking them.
+
+    On PostgreSQL this is a lookup in the search_vector index; elsewhere,
+    a substring match on the name and description.
+    """
+    if ranks_in_database(queryset):
+        return queryset.filter(search_vector=_search_query(query))
+    return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+
+
+def search_adverts(queryset, query):
+    """Filter queryset to adverts matching query and annotate their `rank`, on PostgreSQL."""
+    search_query = _search_query(query)
+    # ts_rank() is a real; as one, it wouldn't equal the double a cursor
+    # carries back, and rows at page boundaries would be skipped or repeated.
+    return queryset.filter(search_vector=search_query)\
+        .annotate(rank=Cast(SearchRank(F('search_vector'), search_query), FloatField()))
+
+
+def search_keys(queryset, query):
+    """Return (-score, id) keys of the adverts matching query, best first, from the process-local index.
+
+    The scores stay in Python: ranking them in SQL would take a CASE branch
+    and a parameter per match.
+    """
+    search_index.build(queryset.db)
+    return sorted((-score, advert_id) for advert_id, score in search_index.search(query).items())
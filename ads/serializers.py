@@ -0,0 +1,33 @@
+from django.core.files.storage import default_storage
+
+from HW.serializers import Field, Serializer
+from ads.images import ready_variant_urls
+from ads.models import Advert, Category
+
+
+def image_url(name):
+    return default_storage.url(name) if name else None
+
+
+def image_variants(name):
+    # Variants are written in the background; link only those already there.
+    return ready_variant_urls(name)[0] if name else {}
+
+
+class AdvertSerializer(Serializer):
+    model = Advert
+
+    name = Field()
+    author = Field('author__username')
+    price = Field(transform=str)
+    description = Field()
+    image = Field(transform=image_url)
+    images = Field('image', transform=image_variants)
+    category = Field('category__name')
+
+
+class CategorySerializer(Serializer):
+    model = Category
+
+    name = Field()
+    adverts_count = Field()
@@ -0,0 +1,94 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ads import counters
+from ads.cache import invalidate_advert, invalidate_author, invalidate_category
+from ads.models import Advert, Category
+from ads.search import search_index
+from ads.suggest import category_index
+from users.models import User
+
+
+# Cached pages are dropped and in-memory indexes updated once the write commits:
+# before that, a concurrent reader could cache the old rows again right after the
+# invalidation, and a rollback would leave the indexes ahead of the table.
+
+@receiver(post_save, sender=Advert)
+@receiver(post_delete, sender=Advert)
+def advert_changed(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(invalidate_advert, instance.pk), using=using)
+
+
+@receiver(post_save, sender=Advert)
+def advert_saved(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(search_index.update, instance), using=using)
+
+
+@receiver(post_delete, sender=Advert)
+def advert_deleted(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(search_index.remove, instance.pk), using=using)
+
+
+# The before states are read from the locked row, not from the instance,
+# which may have been loaded long ago: two saves of one advert then apply
+# their deltas one after the other. Both signals run inside the write's
+# transaction, see Advert.save() and the delete collector.
+
+@receiver(pre_save, sender=Advert)
+def advert_counted_before(sender, instance, using, **kwargs):
+    if instance.pk is None or instance._state.adding:
+        instance._counted_before = None
+    else:
+        instance._counted_before = counters.locked_state(instance.pk, using)
+
+
+@receiver(post_save, sender=Advert)
+def advert_counted_after(sender, instance, using, update_fields=None, **kwargs):
+    before = instance._counted_before
+    counters.apply([before], [counters.saved_state(instance, before, update_fields)], using)
+
+
+@receiver(pre_delete, sender=Advert)
+def advert_uncounted_before(sender, instance, using, **kwargs):
+    instance._counted_before = counters.locked_state(instance.pk, using)
+
+
+@receiver(post_delete, sender=Advert)
+def advert_uncounted(sender, instance, using, **kwargs):
+    counters.apply([instance._counted_before], [], using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(invalidate_category, instance.pk), using=using)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(category_index.update, instance), using=using)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(category_index.remove, instance.pk), using=using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, using, created=False, update_fields=None, **kwargs):
+    # A brand-new user has no adverts to purge, and adverts only embed the username.
+    if not created and (update_fields is None or 'username' in update_fields):
+        transaction.on_commit(partial(invalidate_author, instance.pk), using=using)
+
+
+# loaddata saves raw, which skips auto_now.
+@receiver(pre_save, sender=Advert)
+@receiver(pre_save, sender=Category)
+def fill_updated_at(sender, instance, raw, **kwargs):
+    if raw and instance.updated_at is None:
+        instance.updated_at = timezone.now()
@@ -0,0 +1,4 @@
+from HW.suggest import PrefixIndex
+from ads.models import Category
+
+category_index = PrefixIndex(Category, 'name')
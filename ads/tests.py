@@ -1,3 +1,1203 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from functools import partial
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from HW import profiling, routers
+from HW.cache import reset_stats, stats
+from HW.pagination import ApproximatePaginator, CursorPaginator, estimated_rows
+from ads import counters, images, purge
+from ads.management.commands import fastload
+from ads.management.commands.bench_endpoints import endpoint_routes
+from ads.models import Advert, Category
+from ads.views import AdvertNearbyView
+from ads.search import search_index
+from ads.suggest import category_index
+from users.models import Location, User
+
+
+class AdvertListCursorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        for i in range(12):
+            Advert.objects.create(name=f'Объявление {i}', author=cls.author, price=100 * (i // 2),
+                                  description='', image='images/post1.jpg', category=cls.category,
+                                  is_published=True)
+
+    def test_walks_all_pages_in_price_order(self):
+        names, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get('/ads/', {'cursor': cursor}).json()
+            names += [item['name'] for item in data['items']]
+            cursor = data['next']
+
+        expected = list(Advert.objects.order_by('price', 'id').values_list('name', flat=True))
+        self.assertEqual(names, expected)
+
+    def test_prev_cursor_returns_previous_page(self):
+        first = self.client.get('/ads/', {'cursor': ''}).json()
+        second = self.client.get('/ads/', {'cursor': first['next']}).json()
+        back = self.client.get('/ads/', {'cursor': second['prev']}).json()
+
+        self.assertIsNone(first['prev'])
+        self.assertEqual(back['items'], first['items'])
+
+    def test_keyset_bounds_the_leading_field(self):
+        # An OR of the keyset clauses alone can't start an index scan at the cursor.
+        paginator = CursorPaginator(Advert.objects.all(), ('-price', 'id'), 5)
+        for forward, bound in ((True, ('price__lte', 300)), (False, ('price__gte', 300))):
+            condition = paginator._keyset_filter([300, 7], forward)
+            self.assertEqual((condition.connector, condition.children[0]), ('AND', bound))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/ads/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+        # Well-formed cursors holding values of the wrong type.
+        for payload in (['n', ['x', 'y']], ['n', [['x'], 'y']], ['n', ['100', 'y']], ['p', [1, 2]]):
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+            self.assertEqual(self.client.get('/ads/', {'cursor': cursor}).status_code, 400, payload)
+
+    def test_page_contract_unchanged(self):
+        data = self.client.get('/ads/', {'page': 2}).json()
+        self.assertEqual(data['total'], 12)
+        self.assertEqual(data['num_pages'], 3)
+        self.assertEqual(len(data['items']), 5)
+
+
+@override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=10)
+class ApproximateTotalTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        for i in range(12):
+            cls.create_advert(price=100 * i, is_published=i < 6)
+
+    @classmethod
+    def create_advert(cls, **kwargs):
+        return Advert.objects.create(**{'name': 'Объявление', 'author': cls.author, 'description': '',
+                                        'image': 'images/post1.jpg', 'category': cls.category, **kwargs})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_large_totals_come_from_the_count_cache(self):
+        data = self.client.get('/ads/', {'page': 1}).json()
+        self.assertEqual((data['total'], data['total_exact']), (12, True))
+
+        # Three more adverts: the cached total lags, but no page is cut short by it.
+        for price in (2000, 2100, 2200):
+            self.create_advert(price=price, is_published=True)
+        # The three conditional GET validator queries and the page; the
+        # validator's is the only COUNT, the total comes from the cache.
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/ads/', {'page': 3}).json()
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(len([query for query in queries if 'COUNT(' in query['sql'].upper()]), 1)
+        self.assertEqual((data['total'], data['total_exact']), (12, False))
+        self.assertEqual(len(data['items']), 5)
+
+    def test_small_totals_are_exact(self):
+        self.client.get('/ads/', {'is_published': 'true'})
+        data = self.client.get('/ads/', {'is_published': 'true', 'page': 2}).json()
+        self.assertEqual((data['total'], data['total_exact']), (6, True))
+
+    def test_estimate_ignores_the_soft_delete_filter(self):
+        deleted = User.objects.create(first_name='Пётр', username='petr', password='secret', age=30)
+        self.create_advert(price=1, author=deleted)
+        User.objects.filter(pk=deleted.pk).update(is_deleted=True)
+
+        # Stands in for pg_class.reltuples, which counts the hidden rows too.
+        with mock.patch('HW.pagination._table_estimate', return_value=50_000):
+            self.assertEqual(estimated_rows(Advert.objects.all()), 49_999)
+            self.assertEqual(estimated_rows(User.objects.all()), 49_999)
+            self.assertIsNone(estimated_rows(Advert.objects.filter(is_published=True)))
+            for url in ('/ads/', '/user/'):
+                data = self.client.get(url).json()
+                self.assertEqual((data['total'], data['total_exact']), (49_999, False))
+
+    def test_count_key_separates_parameters(self):
+        keys = {ApproximatePaginator(Advert.objects.filter(name__in=names), 5)._count_key()
+                for names in (['a, b'], ['a', 'b'])}
+        self.assertEqual(len(keys), 2)
+
+
+class ResponseCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        cls.advert = Advert.objects.create(name='Котёнок', author=cls.author, price=100, description='',
+                                           image='images/post1.jpg', category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+
+    def test_detail_is_served_from_cache(self):
+        self.client.get(f'/ads/{self.advert.pk}/')
+        # Only the conditional GET validator query.
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/ads/{self.advert.pk}/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(stats()['hits'], 1)
+        self.assertEqual(stats()['misses'], 1)
+
+    def test_advert_save_invalidates_detail_and_list(self):
+        self.client.get(f'/ads/{self.advert.pk}/')
+        self.client.get('/ads/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.advert.name = 'Щенок'
+            self.advert.save()
+        # Not before the write commits, or a concurrent reader could cache the old row again.
+        self.assertEqual(self.client.get('/ads/').json()['items'][0]['name'], 'Котёнок')
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.client.get(f'/ads/{self.advert.pk}/').json()['name'], 'Щенок')
+        self.assertEqual(self.client.get('/ads/').json()['items'][0]['name'], 'Щенок')
+
+    def test_category_rename_purges_adverts(self):
+        self.client.get(f'/ads/{self.advert.pk}/')
+        self.client.get('/cat/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Кошки'
+            self.category.save()
+
+        self.assertEqual(self.client.get(f'/ads/{self.advert.pk}/').json()['category'], 'Кошки')
+        self.assertEqual(self.client.get('/cat/').json(), [{'name': 'Кошки', 'adverts_count': 1}])
+
+    def test_user_rename_purges_adverts(self):
+        self.client.get('/ads/')
+        self.client.get(f'/ads/{self.advert.pk}/')
+        # The author's namespace drops the adverts' pages without looking them up.
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            self.author.username = 'ivan2'
+            self.author.save()
+
+        self.assertEqual(self.client.get('/ads/').json()['items'][0]['author'], 'ivan2')
+        self.assertEqual(self.client.get(f'/ads/{self.advert.pk}/').json()['author'], 'ivan2')
+
+
+class AdvertBulkCreateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+
+    def row(self, **fields):
+        return {'name': 'Котёнок', 'author': self.author.pk, 'price': 100, 'description': 'Пушистый',
+                'category': self.category.pk, **fields}
+
+    def test_json_array_with_row_errors(self):
+        rows = [self.row(), self.row(author=999), self.row(price='abc'), self.row(name='Щенок')]
+        # in_bulk x2, savepoint, INSERT, category counter UPDATE, release.
+        with self.assertNumQueries(6):
+            response = self.client.post('/ads/bulk/', json.dumps(rows), content_type='application/json')
+
+        data = response.json()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['row'] for item in data['created']], [0, 3])
+        self.assertEqual([error['row'] for error in data['errors']], [1, 2])
+        self.assertEqual(data['errors'][0]['error'], 'author not found')
+        self.assertEqual(Advert.objects.count(), 2)
+
+    def test_ndjson(self):
+        body = '\n'.join([json.dumps(self.row()), 'not json', json.dumps(self.row())])
+        response = self.client.post('/ads/bulk/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(len(response.json()['created']), 2)
+        self.assertEqual(response.json()['errors'], [{'row': 1, 'error': 'row must be a JSON object'}])
+
+    def test_fields_are_validated_like_the_model(self):
+        rows = [self.row(is_published='false'), self.row(description='x' * 5000), self.row(description={'a': 1}),
+                self.row(name=['Котёнок']), self.row(is_published='False'), self.row(description=None)]
+        data = self.client.post('/ads/bulk/', json.dumps(rows), content_type='application/json').json()
+
+        self.assertEqual([item['row'] for item in data['created']], [4, 5])
+        self.assertEqual([list(error['error']) for error in data['errors']],
+                         [['is_published'], ['description'], ['description'], ['name']])
+        self.assertFalse(Advert.objects.filter(is_published=True).exists())
+        self.assertEqual(User.objects.get(pk=self.author.pk).published_adverts_count, 0)
+
+
+class AdvertUpdateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        cls.adverts = [Advert.objects.create(name=f'Котёнок {i}', author=cls.author, price=100, description='',
+                                             category=cls.category, is_published=i < 2) for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+
+    def patch(self, advert, body):
+        return self.client.patch(f'/ads/{advert.pk}/update/', json.dumps(body), content_type='application/json')
+
+    def bulk_update(self, body):
+        return self.client.post('/ads/bulk_update/', json.dumps(body), content_type='application/json')
+
+    def test_patch_writes_only_changed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(self.adverts[0], {'price': '250.50', 'name': 'Котёнок 0'})
+        self.assertEqual(response.json()['price'], '250.50')
+        update, = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "ads_advert"')]
+        self.assertIn('"price"', update)
+        self.assertNotIn('"name"', update)
+        self.assertNotIn('"description"', update)
+
+    def test_patch_errors(self):
+        for body in ({'category': 999}, {'price': 'abc'}, {'author': self.author.pk}, {'name': ''},
+                     {'description': {'a': 1}}, {'name': 5}):
+            self.assertEqual(self.patch(self.adverts[0], body).status_code, 400, body)
+        self.assertEqual(Advert.objects.get(pk=self.adverts[0].pk).description, '')
+
+    def test_bulk_publish(self):
+        self.client.get('/ads/', {'is_published': 'true'})
+        ids = [advert.pk for advert in self.adverts[1:]] + [999]
+        # select, UPDATE, user counter UPDATE, plus the savepoint pair.
+        with self.assertNumQueries(5):
+            response = self.bulk_update({'ids': ids, 'is_published': True})
+        self.assertEqual(response.json(), {'updated': 3, 'unchanged': 1, 'missing': [999]})
+        self.assertEqual(Advert.objects.filter(is_published=True).count(), 5)
+        self.assertEqual(User.objects.get(pk=self.author.pk).published_adverts_count, 5)
+        self.assertEqual(len(self.client.get('/ads/', {'is_published': 'true'}).json()['items']), 5)
+
+        self.bulk_update({'ids': ids[:2], 'is_published': False})
+        self.assertEqual(User.objects.get(pk=self.author.pk).published_adverts_count, 3)
+
+    def test_bulk_reprice(self):
+        self.client.get(f'/ads/{self.adverts[0].pk}/')
+        response = self.bulk_update({'prices': [{'id': self.adverts[0].pk, 'price': 300},
+                                                {'id': self.adverts[1].pk, 'price': '100.00'}]})
+        self.assertEqual(response.json(), {'updated': 1, 'unchanged': 1, 'missing': []})
+        self.assertEqual(self.client.get(f'/ads/{self.adverts[0].pk}/').json()['price'], '300.00')
+
+    def test_bulk_errors(self):
+        for body in ({'ids': [1]}, {'ids': [1], 'price': 'abc'}, {'ids': 'x', 'is_published': True},
+                     {'ids': [1], 'is_published': None}, {'prices': [{'price': 1}]}, {'prices': [], 'ids': []},
+                     {'ids': [True], 'is_published': True}, {'prices': [{'id': True, 'price': 1}]},
+                     {'ids': [2 ** 64], 'is_published': True}):
+            self.assertEqual(self.bulk_update(body).status_code, 400, body)
+
+
+class AdvertExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        category = Category.objects.create(name='Котики')
+        for price in (300, 100, 200):
+            Advert.objects.create(name='Котёнок', author=author, price=price, category=category)
+
+    def test_streams_ndjson(self):
+        response = self.client.get('/ads/export/')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual([row['price'] for row in rows], ['300.00', '100.00', '200.00'])
+        self.assertEqual(rows[0]['author'], 'ivan')
+        self.assertEqual(rows[0]['category'], 'Котики')
+
+    def test_gzip(self):
+        response = self.client.get('/ads/export/', HTTP_ACCEPT_ENCODING='gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_not_buffered_under_asgi(self):
+        response = async_to_sync(self.async_client.get)('/ads/export/')
+        self.assertEqual(response.status_code, 501)
+
+
+class AdvertListFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ivan = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.petr = User.objects.create(first_name='Пётр', username='petr', password='secret', age=30)
+        cls.cats = Category.objects.create(name='Котики')
+        cls.dogs = Category.objects.create(name='Собаки')
+        for name, author, category, price, is_published in [
+            ('Сибирский котёнок', cls.ivan, cls.cats, 2500, True),
+            ('Британский кот', cls.petr, cls.cats, 8000, False),
+            ('Щенок корги', cls.ivan, cls.dogs, 30000, True),
+        ]:
+            Advert.objects.create(name=name, author=author, price=price, category=category, description='',
+                                  image='images/post1.jpg', is_published=is_published)
+
+    def names(self, **params):
+        return [item['name'] for item in self.client.get('/ads/', params).json()['items']]
+
+    def test_filters(self):
+        self.assertEqual(self.names(price_min=3000), ['Британский кот', 'Щенок корги'])
+        self.assertEqual(self.names(price_max=8000, is_published='true'), ['Сибирский котёнок'])
+        self.assertEqual(self.names(category=self.dogs.pk), ['Щенок корги'])
+        self.assertEqual(self.names(author=self.petr.pk), ['Британский кот'])
+        # A whole word: PostgreSQL matches q against search_vector, other databases by substring.
+        self.assertEqual(self.names(q='корги'), ['Щенок корги'])
+
+    def test_filters_with_cursor(self):
+        data = self.client.get('/ads/', {'cursor': '', 'category': self.cats.pk}).json()
+        self.assertEqual([item['name'] for item in data['items']], ['Сибирский котёнок', 'Британский кот'])
+
+    def test_invalid_filter(self):
+        self.assertEqual(self.client.get('/ads/', {'price_min': 'cheap'}).status_code, 400)
+        self.assertEqual(self.client.get('/ads/', {'is_published': 'maybe'}).status_code, 400)
+        self.assertEqual(self.client.get('/ads/', {'category': '99999999999999999999'}).status_code, 400)
+        self.assertEqual(self.client.get('/ads/', {'author': '0'}).status_code, 400)
+
+
+class AdvertSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        category = Category.objects.create(name='Котики')
+        for name, description in [
+            ('Сибирские котята', 'Продаю котят, 3 месяца'),
+            ('Корм для кошек', 'Подходит для котят'),
+            ('Щенок корги', 'Ищет дом'),
+        ]:
+            Advert.objects.create(name=name, author=author, price=100, category=category,
+                                  description=description, image='images/post1.jpg')
+
+    def setUp(self):
+        search_index.clear()
+
+    def names(self, **params):
+        return [item['name'] for item in self.client.get('/ads/search/', params).json()['items']]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.names(q='котята'), ['Сибирские котята', 'Корм для кошек'])
+
+    def test_index_follows_saves(self):
+        self.names(q='корги')
+        advert = Advert.objects.get(name='Щенок корги')
+        advert.name = 'Щенок хаски'
+        with self.captureOnCommitCallbacks(execute=True):
+            advert.save()
+
+        self.assertEqual(self.names(q='корги'), [])
+        self.assertEqual(self.names(q='хаски'), ['Щенок хаски'])
+
+    def test_cursor(self):
+        first = self.client.get('/ads/search/', {'q': 'котят', 'cursor': ''}).json()
+        self.assertEqual(first['next'], None)
+        self.assertEqual(len(first['items']), 2)
+
+    def test_sql_does_not_grow_with_the_matches(self):
+        with mock.patch('HW.settings.TOTAL_ON_PAGE', 1), CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/ads/search/', {'q': 'котята', 'cursor': ''}).json()
+            second = self.client.get('/ads/search/', {'q': 'котята', 'cursor': first['next']}).json()
+        self.assertEqual([item['name'] for item in first['items'] + second['items']],
+                         ['Сибирские котята', 'Корм для кошек'])
+        self.assertFalse(any('CASE' in query['sql'] for query in queries))
+
+    @skipUnless(connection.vendor == 'postgresql', 'ranks are float4 only in PostgreSQL')
+    def test_cursor_pages_meet_exactly(self):
+        author, category = User.objects.get(), Category.objects.get()
+        for i in range(12):
+            Advert.objects.create(name=f'Котята {i}', author=author, price=100, category=category,
+                                  description='котята ' * (i % 4), image='images/post1.jpg')
+        names, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get('/ads/search/', {'q': 'котята', 'cursor': cursor}).json()
+            names += [item['name'] for item in data['items']]
+            cursor = data['next']
+        # The twelve, 'Сибирские котята' and 'Корм для кошек', each once.
+        self.assertEqual(len(set(names)), 14)
+        self.assertEqual(len(names), 14)
+
+    def test_q_required(self):
+        self.assertEqual(self.client.get('/ads/search/').status_code, 400)
+
+
+class AdvertNearbyTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Котики')
+        for username, name, lat, lng, is_published in [
+            ('near', 'Москва, м. Студенческая', 55.738472, 37.548188, True),
+            ('far', 'Москва, м. Черкизовская', 55.804042, 37.744084, True),
+            ('hidden', 'Москва, м. Киевская', 55.743553, 37.565194, False),
+            ('spb', 'Санкт-Петербург', 59.938951, 30.315635, True),
+        ]:
+            user = User.objects.create(first_name='Иван', username=username, password='secret', age=30)
+            user.locations.add(Location.objects.create(name=name, lat=lat, lng=lng))
+            Advert.objects.create(name=username, author=user, price=100, category=category,
+                                  image='images/post1.jpg', is_published=is_published)
+
+    def test_sorted_by_distance(self):
+        data = self.client.get('/ads/nearby/', {'lat': 55.74, 'lng': 37.55, 'radius_km': 20}).json()
+
+        self.assertEqual([item['name'] for item in data['items']], ['near', 'far'])
+        self.assertLess(data['items'][0]['distance_km'], 1)
+
+    def test_radius_excludes_far_locations(self):
+        data = self.client.get('/ads/nearby/', {'lat': 55.74, 'lng': 37.55, 'radius_km': 5}).json()
+        self.assertEqual([item['name'] for item in data['items']], ['near'])
+
+    def test_cursor_pages(self):
+        params = {'lat': 55.74, 'lng': 37.55, 'radius_km': 20}
+        with mock.patch('HW.settings.TOTAL_ON_PAGE', 1), CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/ads/nearby/', {**params, 'cursor': ''}).json()
+            second = self.client.get('/ads/nearby/', {**params, 'cursor': first['next']}).json()
+            back = self.client.get('/ads/nearby/', {**params, 'cursor': second['prev']}).json()
+
+        self.assertEqual([item['name'] for item in first['items'] + second['items']], ['near', 'far'])
+        self.assertEqual((second['next'], back['items']), (None, first['items']))
+        self.assertFalse(any('CASE' in query['sql'] for query in queries))
+        self.assertEqual(self.client.get('/ads/nearby/', {**params, 'cursor': 'WyJuIixbIngiLCJ5Il1d'}).status_code,
+                         400)
+
+    def test_only_the_nearest_are_listed(self):
+        params = {'lat': 55.74, 'lng': 37.55, 'radius_km': 20}
+        # One location per chunk, then a cap that the first chunk already overflows.
+        with mock.patch.object(AdvertNearbyView, 'location_chunk', 1):
+            self.assertEqual([item['name'] for item in self.client.get('/ads/nearby/', params).json()['items']],
+                             ['near', 'far'])
+        with mock.patch('HW.settings.NEARBY_MAX_RESULTS', 1):
+            data = self.client.get('/ads/nearby/', params).json()
+        self.assertEqual(([item['name'] for item in data['items']], data['total']), (['near'], 1))
+
+    def test_geohash_is_stored(self):
+        self.assertTrue(Location.objects.get(name='Санкт-Петербург').geohash.startswith('udtsc'))
+
+    def test_invalid_coordinates(self):
+        self.assertEqual(self.client.get('/ads/nearby/', {'lat': 'x', 'lng': 37}).status_code, 400)
+        self.assertEqual(self.client.get('/ads/nearby/', {'lat': 95, 'lng': 37}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AdvertImageTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        category = Category.objects.create(name='Котики')
+        cls.advert = Advert.objects.create(name='Котёнок', author=author, price=100, category=category)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def upload(self, content, filename='cat.png'):
+        return self.client.post(f'/ads/{self.advert.pk}/image/', {'image': SimpleUploadedFile(filename, content)})
+
+    def png(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), color).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_content_hashed_and_deduplicated(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            first = self.upload(self.png()).json()
+        second = self.upload(self.png(), filename='other.png').json()
+
+        self.assertEqual(len([callback for callback in callbacks if callback.func is images.schedule]), 1)
+        self.assertRegex(first['image'], r'^/images/images/[0-9a-f]{32}\.png$')
+        self.assertEqual(first['image'], second['image'])
+        self.assertEqual((first['images'], set(first['pending'])), ({}, {'small', 'medium', 'large', 'webp'}))
+
+    def test_only_written_variants_are_linked(self):
+        self.upload(self.png('green'))
+        url = f'/ads/{self.advert.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url).json()['images'], {})
+
+        images.process(Advert.objects.get(pk=self.advert.pk).image.name)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        data = self.client.get(url).json()
+        self.assertEqual(set(data['images']), {'small', 'medium', 'large', 'webp'})
+        self.assertEqual(self.client.get(data['images']['small']).status_code, 200)
+        data = self.upload(self.png('green')).json()
+        self.assertEqual((set(data['images']), data['pending']), ({'small', 'medium', 'large', 'webp'}, []))
+
+    def test_variants(self):
+        name = images.store(SimpleUploadedFile('cat.png', self.png('blue')))
+        # The worker thread can't see the test transaction; test_only_written_variants_are_linked covers that part.
+        with mock.patch('ads.images._refresh_adverts'):
+            images.schedule(name).result()
+
+        variants = images.variant_names(name)
+        with Image.open(default_storage.path(variants['small'])) as small:
+            self.assertEqual(small.width, 150)
+        with Image.open(default_storage.path(variants['webp'])) as webp:
+            self.assertEqual((webp.format, webp.size), ('WEBP', (800, 600)))
+
+    def test_rejects_non_images(self):
+        response = self.upload(b'not an image', filename='cat.jpg')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MediaViewTest(TestCase):
+    hashed = 'images/0123456789abcdef0123456789abcdef_small.jpg'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'images'))
+        for name in ('images/post1.jpg', cls.hashed):
+            with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as file:
+                file.write(bytes(range(100)))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, name, **headers):
+        return self.client.get(settings.MEDIA_URL + name, **headers)
+
+    def test_full_file_and_cache_headers(self):
+        response = self.get('images/post1.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('immutable', self.get(self.hashed)['Cache-Control'])
+
+    def test_not_modified(self):
+        etag = self.get(self.hashed)['ETag']
+        response = self.get(self.hashed, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_ranges(self):
+        response = self.get(self.hashed, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        self.assertEqual(b''.join(self.get(self.hashed, HTTP_RANGE='bytes=-5').streaming_content),
+                         bytes(range(95, 100)))
+        self.assertEqual(self.get(self.hashed, HTTP_RANGE='bytes=90-').status_code, 206)
+        self.assertEqual(self.get(self.hashed, HTTP_RANGE='bytes=200-').status_code, 416)
+        # Multiple ranges and stale If-Range get the whole file.
+        self.assertEqual(self.get(self.hashed, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.get(self.hashed, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_missing_and_traversal(self):
+        self.assertEqual(self.get('images/nope.jpg').status_code, 404)
+        self.assertEqual(self.get('images').status_code, 404)
+        self.assertEqual(self.get('../manage.py').status_code, 404)
+
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.get(self.hashed)
+        self.assertEqual(response['X-Accel-Redirect'], settings.MEDIA_ACCEL_PREFIX + self.hashed)
+        self.assertEqual(response.content, b'')
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        cls.advert = Advert.objects.create(name='Котёнок', author=cls.author, price=100, description='',
+                                           image='images/post1.jpg', category=cls.category)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        return response['ETag']
+
+    def test_not_modified(self):
+        for url in ('/ads/', f'/ads/{self.advert.pk}/', '/cat/', f'/cat/{self.category.pk}/',
+                    f'/user/{self.author.pk}/'):
+            with self.subTest(url=url):
+                self.assertRevalidates(url)
+
+    def test_author_rename_changes_advert_etag(self):
+        etag = self.assertRevalidates(f'/ads/{self.advert.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.username = 'ivan2'
+            self.author.save()
+
+        response = self.client.get(f'/ads/{self.advert.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['author'], 'ivan2')
+
+    def test_list_etag_follows_writes_that_bypass_the_cache(self):
+        older = Advert.objects.create(name='Щенок', author=self.author, price=200, image='images/post1.jpg',
+                                      category=self.category)
+        Advert.objects.filter(pk=older.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        etag = self.assertRevalidates('/ads/')
+
+        # Neither write goes through the signals that bump the cache namespaces.
+        Advert.objects.filter(pk=older.pk).delete()
+        self.assertEqual(self.client.get('/ads/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get('/ads/')['ETag']
+        Advert.objects.filter(pk=self.advert.pk).update(price=300, updated_at=timezone.now())
+        self.assertEqual(self.client.get('/ads/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_page_etags_differ(self):
+        Advert.objects.create(name='Щенок', author=self.author, price=200, image='images/post1.jpg',
+                              category=self.category)
+        self.assertNotEqual(self.client.get('/ads/', {'price_min': 150})['ETag'], self.client.get('/ads/')['ETag'])
+
+
+class AsyncReadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        cls.advert = Advert.objects.create(name='Котёнок', author=author, price=100, description='',
+                                           image='images/post1.jpg', category=cls.category)
+
+    async def test_matches_sync_endpoints(self):
+        for path in ('ads/', f'ads/{self.advert.pk}/', 'cat/', f'cat/{self.category.pk}/'):
+            with self.subTest(path=path):
+                sync_response = await sync_to_async(self.client.get)('/' + path)
+                async_response = await self.async_client.get('/async/' + path)
+                self.assertEqual(async_response.json(), sync_response.json())
+
+    async def test_not_found(self):
+        response = await self.async_client.get('/async/ads/0/')
+        self.assertEqual(response.status_code, 404)
+
+
+class FastloadTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def fixture(self, name, records, ndjson=False):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            if ndjson:
+                stream.writelines(json.dumps(record) + '\n' for record in records)
+            else:
+                json.dump(records, stream)
+        return path
+
+    def test_loads_fixtures_with_m2m(self):
+        paths = [self.fixture('location.json', [
+            {'pk': 1, 'model': 'users.Location', 'fields': {'name': 'Москва', 'lat': 55.75, 'lng': 37.61}},
+        ]), self.fixture('user.json', [
+            {'pk': 1, 'model': 'users.User', 'fields': {'first_name': 'Иван', 'username': 'ivan',
+                                                        'password': 'x', 'age': 30, 'locations': [1]}},
+        ]), self.fixture('category.json', [
+            {'pk': 1, 'model': 'ads.Category', 'fields': {'name': 'Котики'}},
+        ]), self.fixture('ad.ndjson', [
+            {'pk': 1, 'model': 'ads.Advert', 'fields': {'name': 'Котёнок', 'author_id': 1, 'price': 100,
+                                                        'category_id': 1, 'is_published': True}},
+            {'pk': 2, 'model': 'ads.Advert', 'fields': {'name': 'Сирота', 'author_id': 99, 'price': 100,
+                                                        'category_id': 1, 'is_published': True}},
+        ], ndjson=True)]
+
+        call_command('fastload', *paths, batch_size=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        user = User.objects.get(username='ivan')
+        self.assertEqual([location.name for location in user.locations.all()], ['Москва'])
+        self.assertTrue(user.locations.get().geohash)
+        self.assertEqual(list(Advert.objects.values_list('pk', flat=True)), [1])
+        self.assertFalse(any(name.endswith('fastload-progress') for name in os.listdir(self.directory)))
+
+    def test_resumes_an_interrupted_load(self):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        category = Category.objects.create(name='Котики')
+        path = self.fixture('ad.ndjson', [
+            {'pk': pk, 'model': 'ads.Advert', 'fields': {'name': f'Котёнок {pk}', 'author_id': author.pk,
+                                                         'price': 100, 'category_id': category.pk,
+                                                         'is_published': True}}
+            for pk in (1, 2, 3)
+        ], ndjson=True)
+        load = partial(call_command, 'fastload', path, batch_size=1, stderr=io.StringIO())
+
+        # Stopped after the first batch committed but before its progress was saved.
+        with mock.patch.object(fastload.Command, 'write_progress', side_effect=OSError), \
+                self.assertRaises(OSError):
+            load(stdout=io.StringIO())
+        # Stopped in the second batch, with the first one's progress saved.
+        write_batch, calls = fastload.Command.write_batch, []
+
+        def interrupted(command, records):
+            calls.append(records)
+            if len(calls) > 1:
+                raise RuntimeError
+            return write_batch(command, records)
+
+        with mock.patch.object(fastload.Command, 'write_batch', interrupted), self.assertRaises(RuntimeError):
+            load(stdout=io.StringIO())
+
+        stdout = io.StringIO()
+        load(stdout=stdout)
+        self.assertIn('resuming after 1 records', stdout.getvalue())
+        load(restart=True, stdout=io.StringIO())
+
+        self.assertEqual(list(Advert.objects.order_by('pk').values_list('pk', flat=True)), [1, 2, 3])
+        self.assertEqual(Category.objects.get(pk=category.pk).adverts_count, 3)
+        self.assertFalse(os.path.exists(f'{path}.fastload-progress'))
+
+
+class AdvertCountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ivan = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.cats = Category.objects.create(name='Котики')
+        cls.dogs = Category.objects.create(name='Собаки')
+
+    def assertCounts(self, published, cats, dogs):
+        self.assertEqual(User.objects.get(pk=self.ivan.pk).published_adverts_count, published)
+        self.assertEqual(Category.objects.get(pk=self.cats.pk).adverts_count, cats)
+        self.assertEqual(Category.objects.get(pk=self.dogs.pk).adverts_count, dogs)
+
+    def test_follows_advert_lifecycle(self):
+        advert = Advert.objects.create(name='Котёнок', author=self.ivan, price=100, category=self.cats)
+        self.assertCounts(0, 1, 0)
+
+        advert.is_published = True
+        advert.save()
+        self.assertCounts(1, 1, 0)
+
+        advert = Advert.objects.get(pk=advert.pk)
+        advert.category = self.dogs
+        advert.save()
+        self.assertCounts(1, 0, 1)
+
+        advert.delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_full_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.ivan.pk)
+        Advert.objects.create(name='Котёнок', author=self.ivan, price=100, category=self.cats, is_published=True)
+        stale.first_name = 'Ваня'
+        stale.save()
+        self.assertCounts(1, 1, 0)
+
+    def test_stale_instances_count_once(self):
+        advert = Advert.objects.create(name='Котёнок', author=self.ivan, price=100, category=self.cats)
+        # Both loaded before either saves, as two concurrent requests would.
+        first, second = Advert.objects.get(pk=advert.pk), Advert.objects.get(pk=advert.pk)
+        for copy in (first, second):
+            copy.is_published = True
+            copy.save()
+        self.assertCounts(1, 1, 0)
+
+        first.category = self.dogs
+        first.save(update_fields=['category'])
+        second.price = 200
+        second.save(update_fields=['price'])
+        self.assertCounts(1, 0, 1)
+
+        # second still thinks the advert is in cats.
+        second.delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_user_delete_cascades_category_counts(self):
+        Advert.objects.create(name='Котёнок', author=self.ivan, price=100, category=self.cats, is_published=True)
+        User.objects.get(pk=self.ivan.pk).delete()
+        self.assertEqual(Category.objects.get(pk=self.cats.pk).adverts_count, 0)
+
+    def test_recount_repairs_drift(self):
+        Advert.objects.create(name='Котёнок', author=self.ivan, price=100, category=self.cats, is_published=True)
+        User.objects.update(published_adverts_count=7)
+        Category.objects.update(adverts_count=0)
+
+        call_command('recount', stdout=io.StringIO())
+        self.assertCounts(1, 1, 0)
+
+
+class SoftDeleteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ivan = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.petr = User.objects.create(first_name='Пётр', username='petr', password='secret', age=30)
+        cls.cats = Category.objects.create(name='Котики')
+        for i in range(5):
+            Advert.objects.create(name=f'Котёнок {i}', author=cls.ivan, price=100, category=cls.cats,
+                                  is_published=True)
+        cls.kept = Advert.objects.create(name='Щенок', author=cls.petr, price=100, category=cls.cats)
+
+    def setUp(self):
+        cache.clear()
+
+    def delete(self, url):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(callbacks, [purge.schedule])
+
+    def test_user_is_hidden_then_purged(self):
+        advert = Advert.objects.filter(author=self.ivan).first()
+        self.client.get('/ads/')
+        self.assertEqual(self.client.get(f'/ads/{advert.pk}/').status_code, 200)
+        self.delete(f'/user/{self.ivan.pk}/delete/')
+
+        self.assertEqual([user['username'] for user in self.client.get('/user/').json()['items']], ['petr'])
+        self.assertEqual(self.client.get(f'/user/{self.ivan.pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/ads/').json()['items'], [self.client.get(f'/ads/{self.kept.pk}/').json()])
+        self.assertEqual(self.client.get(f'/ads/{advert.pk}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/user/{self.ivan.pk}/delete/').status_code, 404)
+
+        # Three batches: the last one only finds the batch empty.
+        self.assertEqual(purge.purge(batch_size=2), (1, 0))
+        self.assertFalse(User.all_objects.filter(pk=self.ivan.pk).exists())
+        self.assertEqual(Advert.all_objects.count(), 1)
+        self.assertEqual(Category.objects.get(pk=self.cats.pk).adverts_count, 1)
+
+    def test_category_is_hidden_then_detached(self):
+        self.delete(f'/cat/{self.cats.pk}/delete/')
+        self.assertEqual(self.client.get('/cat/').json(), [])
+        self.assertEqual(self.client.get(f'/cat/{self.cats.pk}/').status_code, 404)
+
+        call_command('purge_deleted', batch_size=4, stdout=io.StringIO())
+        self.assertFalse(Category.all_objects.exists())
+        self.assertEqual(Advert.objects.filter(category=None).count(), 6)
+
+    def test_counters_survive_recount_before_purge(self):
+        self.delete(f'/user/{self.ivan.pk}/delete/')
+        call_command('recount', stdout=io.StringIO())
+        purge.purge()
+        self.assertEqual(Category.objects.get(pk=self.cats.pk).adverts_count, 1)
+
+    def test_deleted_rows_are_not_assignable(self):
+        Advert.objects.filter(pk=self.kept.pk).update(category=None)
+        self.delete(f'/cat/{self.cats.pk}/delete/')
+        response = self.client.patch(f'/ads/{self.kept.pk}/update/', json.dumps({'category': self.cats.pk}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CategorySuggestTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Котики', 'Кошки', 'котлы', 'Книги', 'Собаки'):
+            Category.objects.create(name=name)
+
+    def setUp(self):
+        category_index.clear()
+        self.addCleanup(category_index.clear)
+
+    def suggest(self, prefix, **params):
+        return [item['name'] for item in self.client.get('/cat/suggest/', {'prefix': prefix, **params}).json()]
+
+    def test_prefix_lookup_without_queries(self):
+        self.assertEqual(self.suggest('ко'), ['Котики', 'котлы', 'Кошки'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('КОТ', limit=1), ['Котики'])
+        self.assertEqual(self.suggest('х'), [])
+
+    def test_follows_signals_and_soft_delete(self):
+        self.suggest('к')
+        category = Category.objects.get(name='Книги')
+        category.name = 'Журналы'
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+            Category.objects.create(name='Котята')
+        self.client.delete(f'/cat/{Category.objects.get(name="Кошки").pk}/delete/')
+
+        self.assertEqual(self.suggest('к'), ['Котики', 'котлы', 'Котята'])
+        self.assertEqual(self.suggest('ж'), ['Журналы'])
+
+    def test_rolled_back_writes_stay_out(self):
+        self.suggest('к')
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Category.objects.create(name='Котята')
+                transaction.set_rollback(True)
+
+        self.assertEqual(self.suggest('кот'), ['Котики', 'котлы'])
+
+    def test_invalid_params(self):
+        for params in ({}, {'prefix': ' '}, {'prefix': 'к', 'limit': 0}, {'prefix': 'к', 'limit': 'x'}):
+            self.assertEqual(self.client.get('/cat/suggest/', params).status_code, 400)
+
+
+class AdvertBatchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        category = Category.objects.create(name='Котики')
+        cls.adverts = [Advert.objects.create(name=f'Котёнок {i}', author=author, price=100, category=category)
+                       for i in range(3)]
+
+    def test_keeps_order_and_reports_missing(self):
+        ids = [self.adverts[2].pk, 999, self.adverts[0].pk, self.adverts[2].pk]
+        with self.assertNumQueries(1):
+            data = self.client.get('/ads/batch/', {'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual(data['items'], [self.client.get(f'/ads/{self.adverts[2].pk}/').json(),
+                                         self.client.get(f'/ads/{self.adverts[0].pk}/').json()])
+        self.assertEqual(data['missing'], [999])
+
+    def test_fields_and_errors(self):
+        data = self.client.get('/ads/batch/', {'ids': self.adverts[1].pk, 'fields': 'name'}).json()
+        self.assertEqual(data['items'], [{'name': 'Котёнок 1'}])
+        for params in ({}, {'ids': 'a,b'}, {'ids': ','.join(map(str, range(1, 1000)))}, {'ids': 1, 'fields': 'x'},
+                       {'ids': '99999999999999999999'}, {'ids': '1,-1'}):
+            self.assertEqual(self.client.get('/ads/batch/', params).status_code, 400)
+
+
+class AdminTest(TestCase):
+    rows = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        User.objects.bulk_create(
+            User(first_name='Иван', username=f'user{i}', password='secret', age=30) for i in range(100))
+        Category.objects.bulk_create(Category(name=f'Категория {i}') for i in range(10))
+        authors, categories = list(User.objects.all()), list(Category.objects.all())
+        Advert.objects.bulk_create(
+            (Advert(name=f'Щенок {i}' if i % 1000 < 2 else f'Котёнок {i}', author=authors[i % len(authors)],
+                    price=i % 1000, category=categories[i % len(categories)], is_published=i % 2 == 0)
+             for i in range(cls.rows)), batch_size=5000)
+        counters.recount()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_advert_changelist(self):
+        self.client.get('/admin/ads/advert/')
+        # Session, admin user, category filter choices and the page with authors
+        # and categories joined; the total is cached from the first request.
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/ads/advert/', {'p': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['cl'].show_full_result_count)
+
+        # As above plus the count. Off PostgreSQL, q is a substring match, case-sensitive for Cyrillic on SQLite.
+        with self.assertNumQueries(5):
+            response = self.client.get('/admin/ads/advert/', {'is_published__exact': '1', 'q': 'Щенок'})
+        self.assertEqual(response.context['cl'].result_count, self.rows // 1000)
+
+    def test_user_changelist_and_autocomplete(self):
+        # Session, admin user, the prefix index build, then the count and the
+        # page, both by primary key.
+        with self.assertNumQueries(5):
+            response = self.client.get('/admin/users/user/', {'q': 'USER1'})
+        self.assertEqual(response.context['cl'].result_count, 11)
+
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'ads', 'model_name': 'advert', 'field_name': 'author', 'term': 'user9'})
+        self.assertEqual(len(response.json()['results']), 11)
+
+    def test_publish_actions_are_single_updates(self):
+        author = User.objects.get(username='user0')
+        changelist = '/admin/ads/advert/'
+        data = {'action': 'unpublish', 'select_across': '1', 'index': '0', '_selected_action': ['1']}
+        # Session, admin user, the changelist's filter choices and count, then a
+        # savepoint pair around reading the rows, one UPDATE and the users' counters.
+        with self.assertNumQueries(10):
+            self.client.post(changelist, data)
+        self.assertFalse(Advert.objects.filter(is_published=True).exists())
+        self.assertEqual(User.objects.get(pk=author.pk).published_adverts_count, 0)
+
+        selected = list(Advert.objects.filter(author=author).values_list('pk', flat=True)[:10])
+        self.client.post(changelist, {'action': 'publish', 'index': '0', '_selected_action': selected})
+        self.assertEqual(User.objects.get(pk=author.pk).published_adverts_count, 10)
+        self.assertEqual(Advert.objects.filter(is_published=True).count(), 10)
+
+
+class SparseFieldsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.category = Category.objects.create(name='Котики')
+        cls.advert = Advert.objects.create(name='Котёнок', author=author, price=100, description='',
+                                           image='images/post1.jpg', category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_full_shape(self):
+        data = self.client.get(f'/ads/{self.advert.pk}/').json()
+        self.assertEqual(data, {'name': 'Котёнок', 'author': 'ivan', 'price': '100.00', 'description': '',
+                                'image': settings.MEDIA_URL + 'images/post1.jpg',
+                                'images': {}, 'category': 'Котики'})
+
+    def test_fields(self):
+        data = self.client.get('/ads/', {'fields': 'name,price'}).json()
+        self.assertEqual(data['items'], [{'name': 'Котёнок', 'price': '100.00'}])
+
+        data = self.client.get(f'/ads/{self.advert.pk}/', {'fields': 'author'}).json()
+        self.assertEqual(data, {'author': 'ivan'})
+        self.assertEqual(self.client.get(f'/ads/{self.advert.pk}/').json()['name'], 'Котёнок')
+
+        data = self.client.get('/cat/', {'fields': 'name'}).json()
+        self.assertEqual(data, [{'name': 'Котики'}])
+
+    def test_unknown_field(self):
+        for url in ('/ads/', f'/ads/{self.advert.pk}/', '/cat/', f'/cat/{self.category.pk}/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'fields': 'name,secret'}).status_code, 400)
+
+    def test_list_queries(self):
+        # Three for the conditional GET validators, then the count and one
+        # joined values() query for the page.
+        with self.assertNumQueries(5):
+            self.client.get('/ads/')
+
+
+class ProfilingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        category = Category.objects.create(name='Котики')
+        cls.advert = Advert.objects.create(name='Котёнок', author=author, price=100, description='',
+                                           image='images/post1.jpg', category=category)
+
+    def setUp(self):
+        cache.clear()
+        profiling.reset()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/cat/'))
+
+    def test_timing_slow_log_and_stats(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.directory, PROFILING_SLOW_QUERIES=2):
+            with self.assertLogs('HW.profiling.slow') as logs:
+                response = self.client.get(f'/ads/{self.advert.pk}/')
+                self.client.get(f'/ads/{self.advert.pk + 1}/')
+                self.client.get('/cat/')
+            profiling.flush()
+
+            out = io.StringIO()
+            call_command('profile_stats', '--json', stdout=out)
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        # Validator, the page's namespaces and the page.
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['pattern'], 'GET /ads/<int:pk>/')
+        self.assertEqual(entry['queries'], 3)
+        self.assertIn('SELECT', entry['sql'][0]['sql'])
+        stats = json.loads(out.getvalue())
+        self.assertEqual(stats['GET /ads/<int:pk>/']['count'], 2)
+        self.assertEqual(stats['GET /cat/']['count'], 1)
+
+
+class GenDataBenchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('gen_data', '--ads', 300, '--users', 40, '--categories', 5, '--batch-size', 100,
+                     stdout=io.StringIO())
+
+    def test_gen_data(self):
+        self.assertEqual((Advert.objects.count(), User.objects.count(), Category.objects.count()), (300, 40, 5))
+        self.assertEqual(Location.objects.count(), 100)
+        self.assertFalse(Location.objects.filter(geohash='').exists())
+        # Counters were maintained while loading, so there is nothing to repair.
+        out = io.StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('fixed 0 users and 0 categories', out.getvalue())
+
+    def test_bench_covers_every_endpoint(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        output = os.path.join(media_root, 'bench.json')
+
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command('bench_endpoints', '--modes', 'client', '--requests', 2, '--warmup', 0,
+                         '--concurrency', 1, '--output', output, stdout=io.StringIO())
+
+        with open(output) as stream:
+            results = json.load(stream)['results']['client']
+        self.assertEqual(set(results), set(endpoint_routes()))
+        self.assertEqual({route: row['error_statuses'] for route, row in results.items() if row['errors']}, {})
+        self.assertEqual(results['ads/<int:pk>/']['queries'], 3)
+        self.assertFalse(User.objects.filter(username__startswith='bench-').exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        routers.reset()
+        self.addCleanup(routers.reset)
+        Category.objects.create(name='Котики')
+
+    def queries_on(self, alias, *requests):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            for request in requests:
+                self.assertLess(request().status_code, 400)
+        return len(queries)
+
+    def test_reads_go_to_the_replica(self):
+        self.assertGreater(self.queries_on('replica', lambda: self.client.get('/cat/')), 0)
+        self.assertEqual(self.queries_on('default', lambda: self.client.get('/user/')), 0)
+
+    def test_writes_pin_reads_to_the_primary(self):
+        create = lambda: self.client.post('/cat/create/', json.dumps({'name': 'Песики'}),  # noqa: E731
+                                          content_type='application/json')
+        self.assertEqual(self.queries_on('replica', create, lambda: self.client.get('/cat/')), 0)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, self.client.cookies)
+
+    def test_cached_pages_are_built_on_the_primary(self):
+        author = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        Advert.objects.create(name='Кот', author=author, price=100, category=Category.objects.get())
+        # Only the conditional GET validators read from the replica.
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.assertEqual(self.client.get('/ads/')['X-Cache'], 'MISS')
+        self.assertTrue(all('MAX(' in query['sql'].upper() for query in queries))
+        self.assertEqual(self.client.get('/ads/')['X-Cache'], 'HIT')
+        self.assertGreater(self.queries_on('replica', lambda: self.client.get('/cat/')), 0)
+
+    def test_failover_to_the_primary(self):
+        with mock.patch.object(connections['replica'], 'ensure_connection', side_effect=OperationalError):
+            self.assertGreater(self.queries_on('default', lambda: self.client.get('/cat/')), 0)
+        # Marked down, so the replica isn't retried right away.
+        self.assertGreater(self.queries_on('default', lambda: self.client.get('/cat/')), 0)
+
+    def test_failure_mid_request_is_retried_on_the_primary(self):
+        with mock.patch.object(connections['replica'], 'create_cursor', side_effect=OperationalError):
+            self.assertGreater(self.queries_on('default', lambda: self.client.get('/cat/')), 0)
+        self.assertEqual(self.queries_on('replica', lambda: self.client.get('/cat/')), 0)
+
+    def test_async_views(self):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = async_to_sync(self.async_client.get)('/async/cat/')
+        self.assertEqual(response.json()[0]['name'], 'Котики')
+        self.assertGreater(len(queries), 0)
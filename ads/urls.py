@@ -4,14 +4,22 @@ from ads import views
 urlpatterns = [
     path('ads/', views.AdvertListView.as_view()),
     path('ads/<int:pk>/', views.AdvertDetailView.as_view()),
+    path('ads/batch/', views.AdvertBatchView.as_view()),
+    path('ads/search/', views.AdvertSearchView.as_view()),
+    path('ads/nearby/', views.AdvertNearbyView.as_view()),
+    path('ads/export/', views.AdvertExportView.as_view()),
     path('ads/create/', views.AdvertCreateView.as_view()),
+    path('ads/bulk/', views.AdvertBulkCreateView.as_view()),
+    path('ads/bulk_update/', views.AdvertBulkUpdateView.as_view()),
     path('ads/<int:pk>/update/', views.AdvertUpdateView.as_view()),
     path('ads/<int:pk>/image/', views.AdvertImageView.as_view()),
     path('ads/<int:pk>/delete/', views.AdvertDeleteView.as_view()),
     path('cat/', views.CatListView.as_view()),
     path('cat/<int:pk>/', views.CatDetailView.as_view()),
+    path('cat/suggest/', views.CatSuggestView.as_view()),
     path('cat/create/', views.CatCreateView.as_view()),
     path('cat/<int:pk>/update/', views.CatUpdateView.as_view()),
     path('cat/<int:pk>/delete/', views.CatDeleteView.as_view()),
+    path('cache/stats/', views.CacheStatsView.as_view()),
 
 ]
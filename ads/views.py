@@ -1,62 +1,207 @@
 import json
+from functools import partial
 
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.functions import Now
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.views import View
 from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView
 
 from HW import settings
+from HW.cache import cached_response, invalidate_keys, invalidate_namespace, stats
+from HW.conditional import conditional_response
+from HW.pagination import InvalidCursor, page_response, paginate, paginate_keys
+from HW.serializers import MAX_ID, InvalidFields, ids_param
+from HW.streaming import ndjson_response
+from HW.suggest import suggest_params
+from HW.updates import apply_changes, load_object, save_changes, to_python
+from ads import counters, images, purge
+from ads.cache import advert_detail_key, advert_detail_namespaces, advert_list_key, category_detail_key
+from ads.cache import category_list_key
+from ads.cache import invalidate_category_counts
+from ads.cache import advert_detail_validators, advert_list_validators
+from ads.cache import category_detail_validators, category_list_validators
+from ads.filters import InvalidFilter, filter_adverts
 from ads.models import Advert, Category
-from users.models import User
+from ads.search import ranks_in_database, search_adverts, search_index, search_keys
+from ads.suggest import category_index
+from ads.serializers import AdvertSerializer, CategorySerializer
+from users.geo import locations_within
+from users.models import Location, User
 
 
 class AdvertListView(ListView):
     model = Advert
 
+    @conditional_response(advert_list_validators)
+    @cached_response(advert_list_key)
     def get(self, request, *args, **kwargs):
         super().get(request, *args, **kwargs)
 
-        self.object_list = self.object_list.select_related('author').prefetch_related('category').order_by('price')
+        try:
+            serializer = AdvertSerializer.from_request(request)
+            self.object_list = filter_adverts(self.object_list, request.GET)
+            page_list = paginate(serializer.queryset(self.object_list, 'price', 'id'), request.GET,
+                                 ('price', 'id'), settings.TOTAL_ON_PAGE)
+            adverts = serializer.serialize(page_list)
+        except (InvalidFilter, InvalidFields) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except InvalidCursor:
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
 
-        paginator = Paginator(self.object_list, settings.TOTAL_ON_PAGE)
-        page_number = request.GET.get('page')
-        page_list = paginator.get_page(page_number)
+        return JsonResponse(page_response(adverts, page_list), safe=False)
 
-        adverts = []
-        for advert in page_list:
-            adverts.append(
-                {'name': advert.name,
-                 'author': advert.author.username,
-                 'price': advert.price,
-                 'description': advert.description,
-                 'image': advert.image.url,
-                 'category': advert.category.name,
-                 }
-            )
 
-        response = {'items':adverts,
-                    'num_pages': page_list.paginator.num_pages,
-                    'total': page_list.paginator.count}
+class AdvertSearchView(ListView):
+    model = Advert
 
-        return JsonResponse(response, safe=False)
+    def get(self, request, *args, **kwargs):
+        super().get(request, *args, **kwargs)
+
+        if not request.GET.get('q'):
+            return JsonResponse({'error': 'q is required'}, status=400)
+
+        try:
+            serializer = AdvertSerializer.from_request(request)
+            if ranks_in_database(self.object_list):
+                adverts = search_adverts(self.object_list, request.GET['q'])
+                page_list = paginate(serializer.queryset(adverts, 'rank', 'id'), request.GET,
+                                     ('-rank', 'id'), settings.TOTAL_ON_PAGE)
+                adverts = serializer.serialize(page_list)
+            else:
+                page_list = paginate_keys(search_keys(self.object_list, request.GET['q']), request.GET,
+                                          (float, int), settings.TOTAL_ON_PAGE)
+                adverts, _ = serializer.serialize_batch(self.object_list, [pk for _, pk in page_list])
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except InvalidCursor:
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
+
+        return JsonResponse(page_response(adverts, page_list), safe=False)
+
+
+def _nearest_adverts(adverts, location_distances, limit, chunk_size):
+    """Return sorted (distance, id) keys of the `limit` adverts whose authors are nearest.
+
+    Locations are walked nearest first, chunk_size at a time, so only the
+    adverts that can make the cut are read.
+    """
+    locations = sorted(location_distances, key=location_distances.get)
+    nearest = {}
+    for start in range(0, len(locations), chunk_size):
+        chunk = locations[start:start + chunk_size]
+        rows = adverts.filter(author__locations__in=chunk).values_list('id', 'author__locations')[:limit + 1]
+        if len(rows) <= limit:
+            # Nearer chunks came first, so an advert keeps the distance it was first seen at.
+            for pk, location_id in rows:
+                nearest[pk] = min(location_distances[location_id], nearest.get(pk, float('inf')))
+        else:
+            # Too many to take whole: take them one location at a time, nearest first.
+            for location_id in chunk:
+                last_pk = 0
+                while len(nearest) < limit:
+                    pks = list(adverts.filter(author__locations=location_id, id__gt=last_pk).order_by('id')
+                               .values_list('id', flat=True)[:limit])
+                    for pk in pks:
+                        nearest.setdefault(pk, location_distances[location_id])
+                    if len(pks) < limit:
+                        break
+                    last_pk = pks[-1]
+                if len(nearest) >= limit:
+                    break
+        if len(nearest) >= limit:
+            break
+    return sorted((distance, pk) for pk, distance in nearest.items())[:limit]
+
+
+class AdvertNearbyView(ListView):
+    """Published adverts by authors located within radius_km, nearest first.
+
+    Only the NEARBY_MAX_RESULTS nearest are listed, so a wide radius over a
+    crowded area costs no more than a narrow one.
+    """
+    model = Advert
+    max_radius_km = 500
+    location_chunk = 100
+
+    def get(self, request, *args, **kwargs):
+        super().get(request, *args, **kwargs)
+
+        try:
+            lat, lng = float(request.GET['lat']), float(request.GET['lng'])
+            radius_km = float(request.GET.get('radius_km', 10))
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'lat and lng are required numbers'}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius_km <= self.max_radius_km):
+            return JsonResponse({'error': 'coordinates or radius out of range'}, status=400)
+
+        # Sorted here rather than in SQL: an ORDER BY distance needs one CASE branch per author.
+        location_distances = locations_within(Location.objects.all(), lat, lng, radius_km)
+        keys = _nearest_adverts(self.object_list.filter(is_published=True), location_distances,
+                                settings.NEARBY_MAX_RESULTS, self.location_chunk)
+        try:
+            serializer = AdvertSerializer.from_request(request)
+            page_list = paginate_keys(keys, request.GET, (float, int), settings.TOTAL_ON_PAGE)
+            adverts, missing = serializer.serialize_batch(self.object_list, [pk for _, pk in page_list])
+            distances = [distance for distance, pk in page_list if pk not in missing]
+            adverts = [{**advert, 'distance_km': round(distance, 3)} for advert, distance in zip(adverts, distances)]
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except InvalidCursor:
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
+
+        return JsonResponse(page_response(adverts, page_list), safe=False)
+
+
+class AdvertExportView(View):
+
+    def get(self, request, *args, **kwargs):
+        rows = Advert.objects.order_by('id').values(
+            'id', 'name', 'author__username', 'price', 'description', 'is_published', 'image', 'category__name',
+        ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+        adverts = ({'id': row['id'],
+                    'name': row['name'],
+                    'author': row['author__username'],
+                    'price': row['price'],
+                    'description': row['description'],
+                    'is_published': row['is_published'],
+                    'image': settings.MEDIA_URL + row['image'] if row['image'] else None,
+                    'category': row['category__name'],
+                    } for row in rows)
+
+        return ndjson_response(request, adverts, 'ads.ndjson')
 
 
 class AdvertDetailView(DetailView):
     model = Advert
 
+    @conditional_response(advert_detail_validators)
+    @cached_response(advert_detail_key, advert_detail_namespaces)
     def get(self, request, *args, **kwargs):
-        advert = self.get_object()
-        return JsonResponse(
-            {'name': advert.name,
-             'author': advert.author.username,
-             'price': advert.price,
-             'description': advert.description,
-             'image': advert.image.url,
-             'category': advert.category.name,
-             }
-        )
+        try:
+            serializer = AdvertSerializer.from_request(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        advert = get_object_or_404(serializer.queryset(Advert.objects.all()), pk=kwargs['pk'])
+        return JsonResponse(serializer.serialize_one(advert))
+
+
+class AdvertBatchView(View):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            serializer = AdvertSerializer.from_request(request)
+            ids = ids_param(request, settings.BATCH_MAX_IDS)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        adverts, missing = serializer.serialize_batch(Advert.objects.all(), ids)
+        return JsonResponse({'items': adverts, 'missing': missing})
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -87,28 +232,202 @@ class AdvertCreateView(CreateView):
         }, status=201)
 
 
+def _parse_bulk_body(body):
+    """Return a list of (row, error) pairs from a JSON array or NDJSON body."""
+    text = body.decode('utf-8')
+    if text.lstrip().startswith('['):
+        rows = json.loads(text)
+    else:
+        rows = []
+        for line in text.splitlines():
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    rows.append(None)
+
+    return [(row, None if isinstance(row, dict) else 'row must be a JSON object') for row in rows]
+
+
+def _to_pk(value):
+    # int() would take True as 1.
+    if isinstance(value, bool):
+        return None
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        return None
+    return pk if 1 <= pk <= MAX_ID else None
+
+
+def _clean_field(name, value):
+    field = Advert._meta.get_field(name)
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise ValidationError(f'{name}: {" ".join(e.messages)}')
+
+
+def _text_errors(row):
+    # clean_fields() would str() anything, so check the text fields' types first.
+    errors = {}
+    for name in ('name', 'description'):
+        try:
+            to_python(Advert._meta.get_field(name), row.get(name))
+        except ValidationError as e:
+            errors[name] = e.messages
+    return errors
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AdvertBulkCreateView(View):
+    batch_size = 1000
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rows = _parse_bulk_body(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'body must be a JSON array or NDJSON'}, status=400)
+
+        valid = [row for row, error in rows if not error]
+        authors = User.objects.in_bulk({_to_pk(row.get('author')) for row in valid} - {None})
+        categories = Category.objects.in_bulk({_to_pk(row.get('category')) for row in valid} - {None})
+
+        adverts, positions, errors = [], [], []
+        for position, (row, error) in enumerate(rows):
+            if not error:
+                author = authors.get(_to_pk(row.get('author')))
+                category = categories.get(_to_pk(row.get('category')))
+                if author is None:
+                    error = 'author not found'
+                elif category is None:
+                    error = 'category not found'
+                else:
+                    error = _text_errors(row) or None
+            if not error:
+                advert = Advert(name=row.get('name'), author=author, price=row.get('price'),
+                                description=row.get('description'), category=category,
+                                is_published=row.get('is_published', False))
+                # The description may be left out: the column is nullable.
+                exclude = ['author', 'category', 'image'] + (['description'] if advert.description is None else [])
+                try:
+                    advert.clean_fields(exclude=exclude)
+                except ValidationError as e:
+                    error = e.message_dict
+            if error:
+                errors.append({'row': position, 'error': error})
+            else:
+                adverts.append(advert)
+                positions.append(position)
+
+        with transaction.atomic():
+            Advert.objects.bulk_create(adverts, batch_size=self.batch_size)
+            counters.apply([], [counters.counted_state(advert) for advert in adverts])
+
+        # bulk_create sends no post_save, so update the cache and search index here.
+        if adverts:
+            invalidate_namespace('ads:list')
+            for advert in adverts:
+                search_index.update(advert)
+
+        return JsonResponse({
+            'created': [{'row': position, 'id': advert.id} for position, advert in zip(positions, adverts)],
+            'errors': errors,
+        }, status=201 if adverts else 400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AdvertBulkUpdateView(View):
+    """Publish, unpublish or re-price many adverts at once.
+
+    {"ids": [...], "is_published": true, "price": "100"} sets the same values
+    on every listed advert in one UPDATE; {"prices": [{"id": 1, "price": 100}, ...]}
+    re-prices each one through bulk_update. Rows already holding the values
+    are left alone.
+    """
+    batch_size = 1000
+    max_ids = 10_000
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = load_object(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'body must be a JSON object'}, status=400)
+
+        try:
+            if 'prices' in data:
+                if set(data) != {'prices'} or not isinstance(data['prices'], list):
+                    raise ValidationError('prices must be the only key and a list')
+                targets = {}
+                for item in data['prices']:
+                    if not isinstance(item, dict) or _to_pk(item.get('id')) is None:
+                        raise ValidationError('each price needs an id')
+                    targets[_to_pk(item['id'])] = {'price': _clean_field('price', item.get('price'))}
+            else:
+                values = {name: _clean_field(name, data[name]) for name in ('is_published', 'price') if name in data}
+                ids = data.get('ids')
+                if not values or set(data) - {'ids', *values} or not isinstance(ids, list):
+                    raise ValidationError('expected ids with is_published and/or price')
+                pks = {_to_pk(pk) for pk in ids}
+                if None in pks:
+                    raise ValidationError('ids must be integers')
+                targets = dict.fromkeys(pks, values)
+        except ValidationError as e:
+            return JsonResponse({'error': e.messages}, status=400)
+        if len(targets) > self.max_ids:
+            return JsonResponse({'error': f'at most {self.max_ids} adverts per request'}, status=400)
+
+        with transaction.atomic():
+            rows = list(Advert.objects.select_for_update().filter(pk__in=list(targets))
+                        .values_list('pk', 'author_id', 'category_id', 'is_published', 'price'))
+            before, after, changed = [], [], []
+            for pk, author_id, category_id, is_published, price in rows:
+                new = {'is_published': is_published, 'price': price, **targets[pk]}
+                if (new['is_published'], new['price']) == (is_published, price):
+                    continue
+                before.append((author_id, category_id, is_published))
+                after.append((author_id, category_id, new['is_published']))
+                changed.append(pk)
+            missing = sorted(set(targets) - {row[0] for row in rows})
+
+            if changed and 'prices' in data:
+                Advert.objects.bulk_update(
+                    [Advert(pk=pk, updated_at=timezone.now(), **targets[pk]) for pk in changed],
+                    ['price', 'updated_at'], batch_size=self.batch_size)
+            elif changed:
+                Advert.objects.filter(pk__in=changed).update(**values, updated_at=Now())
+            counters.apply(before, after)
+
+        # Neither update() nor bulk_update() sends post_save.
+        if changed:
+            invalidate_keys([advert_detail_key(None, pk) for pk in changed])
+            invalidate_namespace('ads:list')
+
+        return JsonResponse({'updated': len(changed), 'unchanged': len(targets) - len(changed) - len(missing),
+                             'missing': missing}, status=200)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class AdvertUpdateView(UpdateView):
     model = Advert
     fields = ['name', 'price', 'description', 'category']
 
     def patch(self, request, *args, **kwargs):
-        super().post(request, *args, **kwargs)
-        advert_data = json.loads(request.body)
-
-        self.object.name = advert_data['name']
-        self.object.price = advert_data['price']
-        self.object.description = advert_data['description']
-        self.object.category = get_object_or_404(Category, pk=advert_data['category'])
-
-        self.object.save()
+        self.object = self.get_object()
+        try:
+            changed = apply_changes(self.object, load_object(request.body), self.fields)
+        except ValueError:
+            return JsonResponse({'error': 'body must be a JSON object'}, status=400)
+        except ValidationError as e:
+            return JsonResponse({'error': e.message_dict}, status=400)
+        save_changes(self.object, changed)
 
         return JsonResponse({
             'id': self.object.id,
             'name': self.object.name,
             'price': self.object.price,
             'description': self.object.description,
-            'category': self.object.category.name
+            'category': self.object.category.name if self.object.category_id else None,
         }, status=201)
 
 
@@ -119,14 +438,23 @@ class AdvertImageView(UpdateView):
 
     def post(self, request, *args, **kwargs):
         self.object = self.get_object()
-        self.object.image = request.FILES['image']
+        if 'image' not in request.FILES:
+            return JsonResponse({'error': 'image is required'}, status=400)
+        try:
+            self.object.image = images.store(request.FILES['image'])
+        except images.InvalidImage as e:
+            return JsonResponse({'error': str(e)}, status=400)
         self.object.save()
+        transaction.on_commit(partial(images.schedule, self.object.image.name))
+        # The variants are written in the background, so most are still missing here.
+        variants, pending = images.ready_variant_urls(self.object.image.name)
 
         return JsonResponse({
                 'id': self.object.id,
                 'name': self.object.name,
-                'image': self.object.image.url}, status=201)
-
+                'image': self.object.image.url,
+                'images': variants,
+                'pending': pending}, status=201)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -146,14 +474,17 @@ class AdvertDeleteView(DeleteView):
 class CatListView(ListView):
     model = Category
 
+    @conditional_response(category_list_validators)
+    @cached_response(category_list_key)
     def get(self, request, *args, **kwargs):
         super().get(request, *args, **kwargs)
 
-        self.object_list.order_by('name')
+        try:
+            serializer = CategorySerializer.from_request(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
-        response = []
-        for category in self.object_list:
-            response.append({'name': category.name})
+        response = serializer.serialize(serializer.queryset(self.object_list.order_by('name')))
 
         return JsonResponse(response, safe=False)
 
@@ -161,9 +492,15 @@ class CatListView(ListView):
 class CatDetailView(DetailView):
     model = Category
 
+    @conditional_response(category_detail_validators)
+    @cached_response(category_detail_key)
     def get(self, request, *args, **kwargs):
-        category = self.get_object()
-        return JsonResponse({'name': category.name})
+        try:
+            serializer = CategorySerializer.from_request(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        category = get_object_or_404(serializer.queryset(Category.objects.all()), pk=kwargs['pk'])
+        return JsonResponse(serializer.serialize_one(category))
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -187,11 +524,14 @@ class CatUpdateView(UpdateView):
     fields = ['name']
 
     def patch(self, request, *args, **kwargs):
-        super().post(request, *args, **kwargs)
-        category_data = json.loads(request.body)
-        self.object.name = category_data['name']
-
-        self.object.save()
+        self.object = self.get_object()
+        try:
+            changed = apply_changes(self.object, load_object(request.body), self.fields)
+        except ValueError:
+            return JsonResponse({'error': 'body must be a JSON object'}, status=400)
+        except ValidationError as e:
+            return JsonResponse({'error': e.message_dict}, status=400)
+        save_changes(self.object, changed)
 
         return JsonResponse({
             'id': self.object.id,
@@ -204,6 +544,29 @@ class CatDeleteView(DeleteView):
     success_url = '/cat'
 
     def delete(self, request, *args, **kwargs):
-        super().delete(request, *args, **kwargs)
+        # Adverts keep showing the category until ads.purge detaches them in batches.
+        with transaction.atomic():
+            if not Category.objects.filter(pk=kwargs['pk']).update(is_deleted=True, updated_at=Now()):
+                raise Http404('no such category')
+            transaction.on_commit(purge.schedule)
+        invalidate_category_counts([kwargs['pk']])
+        category_index.remove(kwargs['pk'])
 
         return JsonResponse({'status': 'ok'}, status=204)
+
+
+class CatSuggestView(View):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            prefix, limit = suggest_params(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse([{'id': pk, 'name': name} for pk, name in category_index.suggest(prefix, limit)],
+                            safe=False)
+
+
+class CacheStatsView(View):
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(stats())
@@ -1,13 +1,20 @@
 from django.contrib import admin
+
+from HW.admin import LargeTableAdminMixin, PrefixSearchAdminMixin
 from users.models import Location, User
+from users.suggest import username_index
+
+
+@admin.register(Location)
+class LocationAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'lat', 'lng', 'geohash')
+    search_fields = ('=geohash',)
 
-admin.site.register(Location)
-admin.site.register(User)
 
-# class LocationAdmin(admin.ModelAdmin):
-#     pass
-#
-#
-# class UserAdmin(admin.ModelAdmin):
-#     pass
-#
\ No newline at end of file
+@admin.register(User)
+class UserAdmin(LargeTableAdminMixin, PrefixSearchAdminMixin, admin.ModelAdmin):
+    list_display = ('username', 'first_name', 'last_name', 'role', 'age', 'published_adverts_count')
+    search_fields = ('username',)
+    prefix_index = username_index
+    # A select of every location would be as long as the table.
+    raw_id_fields = ('locations',)
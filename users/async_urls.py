@@ -0,0 +1,8 @@
+from django.urls import path
+from users import async_views
+
+
+urlpatterns = [
+    path('', async_views.user_list),
+    path('<int:pk>/', async_views.user_detail),
+]
@@ -0,0 +1,41 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from HW import settings
+from HW.pagination import InvalidCursor, page_response, paginate
+from HW.serializers import InvalidFields
+from users.models import User
+from users.serializers import UserListSerializer, UserSerializer
+
+# Async counterparts of UserListView and UserDetailView; see ads.async_views.
+
+
+@sync_to_async
+def _user_page(serializer, params):
+    users = serializer.queryset(User.objects.all(), 'username', 'id')
+    page_list = paginate(users, params, ('username', 'id'), settings.TOTAL_ON_PAGE)
+    return page_response(serializer.serialize(page_list), page_list)
+
+
+async def user_list(request):
+    try:
+        response = await _user_page(UserListSerializer.from_request(request), request.GET)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except InvalidCursor:
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    return JsonResponse(response, safe=False)
+
+
+@sync_to_async
+def _user_detail(serializer, pk):
+    return serializer.serialize_one(get_object_or_404(serializer.queryset(User.objects.all()), pk=pk))
+
+
+async def user_detail(request, pk):
+    try:
+        serializer = UserSerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(await _user_detail(serializer, pk))
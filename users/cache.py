@@ -0,0 +1,11 @@
+from urllib.parse import urlencode
+
+from users.models import User
+
+
+def user_detail_validators(request, pk):
+    updated_at = User.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    query = urlencode(sorted(request.GET.items()))
+    return f'user-{pk}-{updated_at.timestamp()}-{query}', updated_at
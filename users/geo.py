@@ -0,0 +1,91 @@
+import math
+
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# Upper bound on the number of cells scanned per query; the precision is
+# lowered until the bounding box fits.
+MAX_CELLS = 16
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, value = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return (lat_degrees, lng_degrees) covered by one geohash cell."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    return 180.0 / 2 ** (total_bits - lng_bits), 360.0 / 2 ** lng_bits
+
+
+def bounding_box(lat, lng, radius_km):
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    lng_delta = 180.0 if cos_lat < 1e-6 else min(180.0, lat_delta / cos_lat)
+    return (max(-90.0, lat - lat_delta), min(90.0, lat + lat_delta),
+            max(-180.0, lng - lng_delta), min(180.0, lng + lng_delta))
+
+
+def covering_cells(min_lat, max_lat, min_lng, max_lng):
+    """Return the geohash prefixes covering a bounding box, at most MAX_CELLS of them."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lng_step = cell_size(precision)
+        rows = math.floor(max_lat / lat_step) - math.floor(min_lat / lat_step) + 1
+        columns = math.floor(max_lng / lng_step) - math.floor(min_lng / lng_step) + 1
+        if rows * columns <= MAX_CELLS:
+            break
+
+    cells = set()
+    for row in range(rows):
+        for column in range(columns):
+            cell_lat = min(max_lat, min_lat + row * lat_step)
+            cell_lng = min(max_lng, min_lng + column * lng_step)
+            cells.add(encode_geohash(cell_lat, cell_lng, precision))
+    return cells
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def locations_within(queryset, lat, lng, radius_km):
+    """Return {location_id: distance_km} for locations within radius_km.
+
+    Geohash prefixes narrow the scan to a few index ranges, the bounding box
+    drops the corners of those cells, and haversine makes the exact cut.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    cells = Q()
+    for cell in covering_cells(min_lat, max_lat, min_lng, max_lng):
+        cells |= Q(geohash__startswith=cell)
+
+    candidates = queryset.filter(cells, lat__range=(min_lat, max_lat), lng__range=(min_lng, max_lng))\
+        .values_list('id', 'lat', 'lng')
+
+    distances = {}
+    for location_id, location_lat, location_lng in candidates:
+        distance = haversine_km(lat, lng, float(location_lat), float(location_lng))
+        if distance <= radius_km:
+            distances[location_id] = distance
+    return distances
@@ -0,0 +1,43 @@
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from users.geo import encode_geohash
+from users.models import Location
+
+COORDINATE = Decimal('0.000001')
+
+
+def _key(name, lat, lng):
+    return name, Decimal(str(lat)).quantize(COORDINATE), Decimal(str(lng)).quantize(COORDINATE)
+
+
+def _lookup(keys):
+    condition = reduce(or_, (Q(name=name, lat=lat, lng=lng) for name, lat, lng in keys))
+    return {_key(location.name, location.lat, location.lng): location
+            for location in Location.objects.filter(condition)}
+
+
+def resolve_locations(locations_data):
+    """Return Location rows for [{'name', 'lat', 'lng'}, ...], creating the missing ones.
+
+    One lookup for all of them, one bulk insert of the missing ones (racing
+    inserts are absorbed by the unique constraint), and one more lookup for
+    the ids of what was inserted.
+    """
+    keys = list(dict.fromkeys(_key(item['name'], item['lat'], item['lng']) for item in locations_data))
+    if not keys:
+        return []
+
+    found = _lookup(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # bulk_create skips pre_save, which is where geohash is normally set.
+        Location.objects.bulk_create([
+            Location(name=name, lat=lat, lng=lng, geohash=encode_geohash(float(lat), float(lng)))
+            for name, lat, lng in missing
+        ], ignore_conflicts=True)
+        found.update(_lookup(missing))
+    return [found[key] for key in keys]
@@ -0,0 +1,45 @@
+# Generated by Django 4.0.2 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('lng', models.DecimalField(decimal_places=6, max_digits=9)),
+            ],
+            options={
+                'verbose_name': 'Локация',
+                'verbose_name_plural': 'Локации',
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50, null=True)),
+                ('username', models.CharField(max_length=50, unique=True)),
+                ('password', models.CharField(max_length=15)),
+                ('role', models.CharField(choices=[('member', 'участник'), ('moderator', 'модератор'), ('admin', 'админ')], default='member', max_length=10)),
+                ('age', models.SmallIntegerField()),
+                ('locations', models.ManyToManyField(to='users.Location')),
+            ],
+            options={
+                'verbose_name': 'Пользователь',
+                'verbose_name_plural': 'Пользователи',
+                'ordering': ['username'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+from users.geo import encode_geohash
+
+
+def fill_geohash(apps, schema_editor):
+    Location = apps.get_model('users', 'Location')
+    locations = list(Location.objects.all())
+    for location in locations:
+        location.geohash = encode_geohash(float(location.lat), float(location.lng))
+    Location.objects.bulk_update(locations, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=9),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='published_adverts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
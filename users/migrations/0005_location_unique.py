@@ -0,0 +1,41 @@
+# Generated by Django 4.0.2 on 2026-10-18 11:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_locations(apps, schema_editor):
+    Location = apps.get_model('users', 'Location')
+    Through = apps.get_model('users', 'User').locations.through
+
+    groups = Location.objects.values('name', 'lat', 'lng').annotate(keep=Min('id'), rows=Count('id'))\
+        .filter(rows__gt=1)
+    for group in groups:
+        duplicates = list(Location.objects.filter(name=group['name'], lat=group['lat'], lng=group['lng'])
+                          .exclude(id=group['keep']).values_list('id', flat=True))
+        linked = set(Through.objects.filter(location_id=group['keep']).values_list('user_id', flat=True))
+        moved = set(Through.objects.filter(location_id__in=duplicates).values_list('user_id', flat=True))
+
+        Through.objects.filter(location_id__in=duplicates).delete()
+        Through.objects.bulk_create([Through(user_id=user_id, location_id=group['keep'])
+                                     for user_id in moved - linked])
+        Location.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL can't ALTER a table with pending trigger events from the
+    # deletes, so the merge commits in its own transaction before the
+    # constraint is added.
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_adverts_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_locations, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(fields=('name', 'lat', 'lng'), name='location_unique'),
+        ),
+    ]
@@ -1,9 +1,15 @@
 from django.db import models
+from django.db.models import Q
+
+from HW.models import CounterFieldsMixin, SoftDeleteManager
+from users.geo import GEOHASH_PRECISION
+
 
 class Location(models.Model):
     name = models.CharField(max_length=100)
     lat = models.DecimalField(max_digits=9, decimal_places=6)
     lng = models.DecimalField(max_digits=9, decimal_places=6)
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, db_index=True, editable=False, default='')
 
     def __str__(self):
         return self.name
@@ -11,9 +17,12 @@ class Location(models.Model):
     class Meta():
         verbose_name = 'Локация'
         verbose_name_plural = 'Локации'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'lat', 'lng'], name='location_unique'),
+        ]
 
 
-class User(models.Model):
+class User(CounterFieldsMixin, models.Model):
     ROLE = [('member', 'участник'), ('moderator', 'модератор'), ('admin', 'админ')]
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50, null=True)
@@ -22,6 +31,15 @@ class User(models.Model):
     role = models.CharField(max_length=10, choices=ROLE, default='member')
     age = models.SmallIntegerField()
     locations = models.ManyToManyField(Location)
+    published_adverts_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Set by the delete endpoint; ads.purge removes the adverts and then the row.
+    is_deleted = models.BooleanField(default=False, editable=False)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    counter_fields = ('published_adverts_count',)
 
     def __str__(self):
         return self.username
@@ -30,4 +48,8 @@ class User(models.Model):
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ['username']
+        indexes = [
+            # Only the few rows waiting for the purger.
+            models.Index(fields=['id'], name='user_deleted_idx', condition=Q(is_deleted=True)),
+        ]
 
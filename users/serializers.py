@@ -0,0 +1,18 @@
+from HW.serializers import Field, Many, Serializer
+from users.models import User
+
+
+class UserSerializer(Serializer):
+    model = User
+
+    id = Field()
+    username = Field()
+    first_name = Field()
+    last_name = Field()
+    role = Field()
+    age = Field()
+    locations = Many(attr='name')
+
+
+class UserListSerializer(UserSerializer):
+    adverts = Field('published_adverts_count')
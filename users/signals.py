@@ -0,0 +1,33 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.geo import encode_geohash
+from users.models import Location, User
+from users.suggest import username_index
+
+
+# pre_save rather than Location.save() so fixtures loaded with loaddata get it too.
+@receiver(pre_save, sender=Location)
+def location_geohash(sender, instance, **kwargs):
+    instance.geohash = encode_geohash(float(instance.lat), float(instance.lng))
+
+
+# loaddata saves raw, which skips auto_now.
+@receiver(pre_save, sender=User)
+def fill_updated_at(sender, instance, raw, **kwargs):
+    if raw and instance.updated_at is None:
+        instance.updated_at = timezone.now()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(username_index.update, instance), using=using)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(username_index.remove, instance.pk), using=using)
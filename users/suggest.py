@@ -0,0 +1,4 @@
+from HW.suggest import PrefixIndex
+from users.models import User
+
+username_index = PrefixIndex(User, 'username')
@@ -1,3 +1,173 @@
+import json
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ads.models import Advert, Category
+from users.locations import resolve_locations
+from users.models import Location, User
+from users.suggest import username_index
+
+
+class UserQueryCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Котики')
+        locations = [Location.objects.create(name=f'Локация {i}', lat=55.7 + i, lng=37.5 + i) for i in range(3)]
+        for i in range(8):
+            user = User.objects.create(first_name='Иван', username=f'user{i}', password='secret', age=20 + i)
+            user.locations.add(*locations[:i % 3 + 1])
+            Advert.objects.create(name='Объявление', author=user, price=100, category=category,
+                                  image='images/post1.jpg', is_published=bool(i % 2))
+        cls.user = User.objects.get(username='user0')
+
+    def test_list(self):
+        with self.assertNumQueries(3):
+            data = self.client.get('/user/').json()
+        self.assertEqual(len(data['items']), 5)
+        self.assertEqual(data['items'][0]['locations'], ['Локация 0'])
+        self.assertEqual(data['items'][1]['adverts'], 1)
+
+    def test_list_cursor(self):
+        with self.assertNumQueries(2):
+            self.client.get('/user/', {'cursor': ''})
+
+    def test_list_fields(self):
+        data = self.client.get('/user/', {'fields': 'username,locations'}).json()
+        self.assertEqual(data['items'][0], {'username': 'user0', 'locations': ['Локация 0']})
+        # Without locations the M2M query is skipped.
+        with self.assertNumQueries(2):
+            data = self.client.get('/user/', {'fields': 'username'}).json()
+        self.assertEqual(data['items'][1], {'username': 'user1'})
+
+    def test_detail(self):
+        # One of these is the conditional GET validator.
+        with self.assertNumQueries(3):
+            data = self.client.get(f'/user/{self.user.pk}/').json()
+        self.assertEqual(data['locations'], ['Локация 0'])
+
+    def test_batch(self):
+        ids = [User.objects.get(username='user2').pk, 999, self.user.pk]
+        # The users, then their locations.
+        with self.assertNumQueries(2):
+            data = self.client.get('/user/batch/', {'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual([user['username'] for user in data['items']], ['user2', 'user0'])
+        self.assertEqual(data['items'][1], self.client.get(f'/user/{self.user.pk}/').json())
+        self.assertEqual(data['missing'], [999])
+
+    def test_create(self):
+        body = {'username': 'new', 'password': 'secret', 'first_name': 'Пётр', 'last_name': 'Петров',
+                'role': 'member', 'age': 33,
+                'locations': [{'name': 'Локация 0', 'lat': 55.7, 'lng': 37.5},
+                              {'name': 'Новая', 'lat': 50, 'lng': 30}]}
+        # User INSERT, location lookup, INSERT of the new one and its id lookup, M2M INSERT.
+        with self.assertNumQueries(5):
+            response = self.client.post('/user/create/', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['locations'], ['Локация 0', 'Новая'])
+
+    def test_update(self):
+        body = {'username': 'user0', 'password': 'secret', 'first_name': 'Иван', 'last_name': None,
+                'age': 21, 'locations': [{'name': 'Локация 1', 'lat': 56.7, 'lng': 38.5}]}
+        # Only age changed, so the username embedded in adverts needs no purge.
+        with self.assertNumQueries(5):
+            response = self.client.patch(f'/user/{self.user.pk}/update/', json.dumps(body),
+                                         content_type='application/json')
+        self.assertEqual(response.json()['locations'], ['Локация 0', 'Локация 1'])
+        self.assertEqual(response.json()['age'], 21)
+
+    def test_partial_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f'/user/{self.user.pk}/update/', json.dumps({'first_name': 'Пётр'}),
+                                         content_type='application/json')
+        self.assertEqual(response.json()['first_name'], 'Пётр')
+        update, = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertIn('"first_name"', update)
+        self.assertNotIn('"username"', update)
+
+        # Nothing changed, nothing written.
+        with self.assertNumQueries(2):
+            self.client.patch(f'/user/{self.user.pk}/update/', json.dumps({'first_name': 'Пётр'}),
+                              content_type='application/json')
+
+    def test_update_errors(self):
+        for body in ({'role': 'admin'}, {'age': 'old'}, {'username': 'user1'}, [], {'first_name': ['Иван']}):
+            response = self.client.patch(f'/user/{self.user.pk}/update/', json.dumps(body),
+                                         content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+class UserExportTest(TestCase):
+
+    def test_groups_locations_per_user(self):
+        locations = [Location.objects.create(name=f'Локация {i}', lat=55, lng=37) for i in range(2)]
+        User.objects.create(first_name='Иван', username='ivan', password='secret', age=30).locations.add(*locations)
+        User.objects.create(first_name='Пётр', username='petr', password='secret', age=30)
+
+        response = self.client.get('/user/export/')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual([row['username'] for row in rows], ['ivan', 'petr'])
+        self.assertEqual(sorted(rows[0]['locations']), ['Локация 0', 'Локация 1'])
+        self.assertEqual(rows[1]['locations'], [])
+
+
+class AsyncUserReadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(first_name='Иван', username='ivan', password='secret', age=30)
+        cls.user.locations.add(Location.objects.create(name='Москва', lat=55.75, lng=37.61))
+
+    async def test_list_and_detail(self):
+        data = (await self.async_client.get('/async/user/')).json()
+        self.assertEqual(data['items'][0]['locations'], ['Москва'])
+        self.assertEqual(data['items'][0]['adverts'], 0)
+
+        data = (await self.async_client.get(f'/async/user/{self.user.pk}/')).json()
+        self.assertEqual(data['username'], 'ivan')
+
+
+class UserSuggestTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for username in ('anna', 'Andrey', 'boris', 'annette'):
+            User.objects.create(first_name='Иван', username=username, password='secret', age=30)
+
+    def setUp(self):
+        username_index.clear()
+        self.addCleanup(username_index.clear)
+
+    def suggest(self, prefix):
+        return [item['username'] for item in self.client.get('/user/suggest/', {'prefix': prefix}).json()]
+
+    def test_suggest(self):
+        self.assertEqual(self.suggest('an'), ['Andrey', 'anna', 'annette'])
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(first_name='Иван', username='anatoly', password='secret', age=30)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('ANA'), ['anatoly'])
+
+        self.client.delete(f'/user/{user.pk}/delete/')
+        self.assertEqual(self.suggest('ana'), [])
+
+
+class ResolveLocationsTest(TestCase):
+
+    def test_reuses_and_creates_without_duplicates(self):
+        existing = Location.objects.create(name='Москва', lat=55.75, lng=37.61)
+        data = [{'name': 'Москва', 'lat': 55.75, 'lng': 37.61},
+                {'name': 'Тверь', 'lat': '56.858745', 'lng': 35.900557},
+                {'name': 'Тверь', 'lat': 56.858745, 'lng': '35.900557'}]
+
+        with self.assertNumQueries(3):
+            locations = resolve_locations(data)
 
-# Create your tests here.
+        self.assertEqual(locations[0], existing)
+        self.assertEqual([location.name for location in locations], ['Москва', 'Тверь'])
+        self.assertTrue(locations[1].geohash)
+        self.assertEqual(resolve_locations(data), locations)
+        self.assertEqual(Location.objects.count(), 2)
@@ -5,6 +5,9 @@ from users import views
 urlpatterns = [
     path('', views.UserListView.as_view()),
     path('<int:pk>/', views.UserDetailView.as_view()),
+    path('batch/', views.UserBatchView.as_view()),
+    path('export/', views.UserExportView.as_view()),
+    path('suggest/', views.UserSuggestView.as_view()),
     path('create/', views.UserCreateView.as_view()),
     path('<int:pk>/update/', views.UserUpdateView.as_view()),
     path('<int:pk>/delete/', views.UserDeleteView.as_view()),
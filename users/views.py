@@ -1,63 +1,108 @@
 import json
-
-from django.core.paginator import Paginator
-from django.db.models import Count, Q, F
-from django.http import JsonResponse
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.functions import Now
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import CreateView, DetailView, UpdateView, DeleteView
 
 from HW import settings
-from users.models import User, Location
+from HW.conditional import conditional_response
+from HW.pagination import InvalidCursor, page_response, paginate
+from HW.serializers import InvalidFields, ids_param
+from HW.streaming import ndjson_response
+from HW.suggest import suggest_params
+from HW.updates import apply_changes, load_object, save_changes
+from ads import purge
+from ads.cache import invalidate_author
+from users.cache import user_detail_validators
+from users.locations import resolve_locations
+from users.models import User
+from users.serializers import UserListSerializer, UserSerializer
+from users.suggest import username_index
 
 
 class UserListView(View):
 
     def get(self, request):
 
-        user_qs = User.objects.annotate(adverts=Count('advert', filter=Q(advert__is_published=True))).order_by('username')
+        try:
+            serializer = UserListSerializer.from_request(request)
+            page_list = paginate(serializer.queryset(User.objects.all(), 'username', 'id'), request.GET,
+                                 ('username', 'id'), settings.TOTAL_ON_PAGE)
+            users = serializer.serialize(page_list)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except InvalidCursor:
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
+
+        return JsonResponse(page_response(users, page_list), safe=False)
 
-        paginator = Paginator(user_qs, settings.TOTAL_ON_PAGE)
-        page_number = request.GET.get('page')
-        page_list = paginator.get_page(page_number)
 
-        users = []
-        for user in page_list:
-            users.append(
-                {'id': user.id,
-                 'username': user.username,
-                 'first_name': user.first_name,
-                 'last_name': user.last_name,
-                 'role': user.role,
-                 'age': user.age,
-                 'locations': list(map(str, user.locations.all())),
-                 'adverts': user.adverts
-                 }
-            )
+class UserSuggestView(View):
 
-        response = {'items': users,
-                    'num_pages': page_list.paginator.num_pages,
-                    'total': page_list.paginator.count}
+    def get(self, request):
+        try:
+            prefix, limit = suggest_params(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse([{'id': pk, 'username': username}
+                             for pk, username in username_index.suggest(prefix, limit)], safe=False)
 
-        return JsonResponse(response, safe=False)
+
+class UserExportView(View):
+
+    def get(self, request):
+        # One row per (user, location); rows of a user are adjacent because of the ordering.
+        rows = User.objects.order_by('id').values(
+            'id', 'username', 'first_name', 'last_name', 'role', 'age', 'locations__name',
+        ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+        def users():
+            for _, user_rows in groupby(rows, key=itemgetter('id')):
+                user_rows = list(user_rows)
+                user = user_rows[0]
+                yield {'id': user['id'],
+                       'username': user['username'],
+                       'first_name': user['first_name'],
+                       'last_name': user['last_name'],
+                       'role': user['role'],
+                       'age': user['age'],
+                       'locations': [row['locations__name'] for row in user_rows if row['locations__name'] is not None],
+                       }
+
+        return ndjson_response(request, users(), 'users.ndjson')
 
 
 class UserDetailView(DetailView):
     model = User
 
+    @conditional_response(user_detail_validators)
     def get(self, request, *args, **kwargs):
-        user = self.get_object()
-        return JsonResponse(
-            {'id': user.id,
-             'username': user.username,
-             'first_name': user.first_name,
-             'last_name': user.last_name,
-             'role': user.role,
-             'age': user.age,
-             'locations': list(map(str, user.locations.all())),
-             }
-        )
+        try:
+            serializer = UserSerializer.from_request(request)
+        except InvalidFields as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        user = get_object_or_404(serializer.queryset(User.objects.all()), pk=kwargs['pk'])
+        return JsonResponse(serializer.serialize_one(user))
+
+
+class UserBatchView(View):
+
+    def get(self, request):
+        try:
+            serializer = UserSerializer.from_request(request)
+            ids = ids_param(request, settings.BATCH_MAX_IDS)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        users, missing = serializer.serialize_batch(User.objects.all(), ids)
+        return JsonResponse({'items': users, 'missing': missing})
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -77,21 +122,13 @@ class UserCreateView(CreateView):
             age=user_data['age'],
         )
 
-        for location in user_data['locations']:
-            location_obj, _ = Location.objects.get_or_create(name=location['name'],
-                                                           lat=location['lat'],
-                                                           lng=location['lng'])
-            new_user.locations.add(location_obj)
+        location_objs = resolve_locations(user_data['locations'])
+        new_user.locations.add(*location_objs)
 
-        return JsonResponse({
-            'id': new_user.id,
-            'username': new_user.username,
-            'first_name': new_user.first_name,
-            'last_name': new_user.last_name,
-            'role': new_user.role,
-            'age': new_user.age,
-            'locations': list(map(str, new_user.locations.all())),
-        }, status=201)
+        # A new user has no locations besides the ones just added,
+        # so there is no need to read them back.
+        locations = [location.name for location in location_objs]
+        return JsonResponse(UserSerializer().instance(new_user, locations=locations), status=201)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -100,32 +137,23 @@ class UserUpdateView(UpdateView):
     fields = ['username', 'password', 'first_name', 'last_name', 'age', 'locations']
 
     def patch(self, request, *args, **kwargs):
-        super().post(request, *args, **kwargs)
-        user_data = json.loads(request.body)
-
-        self.object.username = user_data['username']
-        self.object.password = user_data['password']
-        self.object.first_name = user_data['first_name']
-        self.object.last_name = user_data['last_name']
-        self.object.age = user_data['age']
-
-        for location in user_data['locations']:
-            location_obj, _ = Location.objects.get_or_create(name=location['name'],
-                                                           lat=location['lat'],
-                                                           lng=location['lng'])
-            self.object.locations.add(location_obj)
+        self.object = self.get_object()
+        try:
+            user_data = load_object(request.body)
+            locations = user_data.pop('locations', [])
+            changed = apply_changes(self.object, user_data, [name for name in self.fields if name != 'locations'])
+        except ValueError:
+            return JsonResponse({'error': 'body must be a JSON object'}, status=400)
+        except ValidationError as e:
+            return JsonResponse({'error': e.message_dict}, status=400)
 
-        self.object.save()
+        if locations:
+            self.object.locations.add(*resolve_locations(locations))
+            # The detail validators only look at updated_at.
+            changed = changed or ['updated_at']
+        save_changes(self.object, changed)
 
-        return JsonResponse({
-            'id': self.object.id,
-            'username': self.object.username,
-            'first_name': self.object.first_name,
-            'last_name': self.object.last_name,
-            'role': self.object.role,
-            'age': self.object.age,
-            'locations': list(map(str, self.object.locations.all())),
-        }, status=200)
+        return JsonResponse(UserSerializer().instance(self.object), status=200)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -134,6 +162,12 @@ class UserDeleteView(DeleteView):
     success_url = '/'
 
     def delete(self, request, *args, **kwargs):
-        super().delete(request, *args, **kwargs)
+        # The adverts go in bounded batches in the background, see ads.purge.
+        with transaction.atomic():
+            if not User.objects.filter(pk=kwargs['pk']).update(is_deleted=True, updated_at=Now()):
+                raise Http404('no such user')
+            transaction.on_commit(purge.schedule)
+        invalidate_author(kwargs['pk'])
+        username_index.remove(kwargs['pk'])
 
         return JsonResponse({'status': 'ok'}, status=204)